@@ -12,6 +12,14 @@ CUSTOM_PACK_NAME = getenv("CUSTOM_PACK_NAME")
 
 # DISABLED_SUPERUSERS: set[int] = set()
 
+FBAN_CHAT_INTERVAL: float = float(getenv("FBAN_CHAT_INTERVAL", 1))
+
+FBAN_CONCURRENCY: int = int(getenv("FBAN_CONCURRENCY", 8))
+
+FBAN_DEAD_RUNS: int = int(getenv("FBAN_DEAD_RUNS", 5))
+
+FBAN_DEAD_RETRY: float = float(getenv("FBAN_DEAD_RETRY", 60))
+
 FBAN_LOG_CHANNEL: int = int(getenv("FBAN_LOG_CHANNEL") or getenv("LOG_CHAT"))
 
 FBAN_SUDO_ID: int = int(getenv("FBAN_SUDO_ID", 0))
@@ -20,12 +28,24 @@ FBAN_SUDO_USERNAME = getenv("FBAN_SUDO_USERNAME")
 
 FBAN_SUDO_TRIGGER: str = getenv("FBAN_SUDO_TRIGGER")
 
+FBAN_WORKERS: int = int(getenv("FBAN_WORKERS", 2))
+
 GEMINI_API_KEY: str = getenv("GEMINI_API_KEY")
 
 INDEX_EXTRA_MODULES: int = int(getenv("INDEX_EXTRA_MODULES", 0))
 
 LOAD_HANDLERS: bool = True
 
+LOGGER_CHAT_CAPACITY: int = int(getenv("LOGGER_CHAT_CAPACITY", 200))
+
+LOGGER_QUEUE_LIMIT: int = int(getenv("LOGGER_QUEUE_LIMIT", 2000))
+
+LOGGER_QUEUE_MAX_MB: int = int(getenv("LOGGER_QUEUE_MAX_MB", 16))
+
+MEDIA_CACHE_SIZE: int = int(getenv("MEDIA_CACHE_SIZE", 1024))
+
+MEDIA_CACHE_TTL: int = int(getenv("MEDIA_CACHE_TTL", 24))
+
 MESSAGE_LOGGER_CHAT: int = int(getenv("MESSAGE_LOGGER_CHAT") or getenv("LOG_CHAT"))
 
 PM_GUARD: bool = False
@@ -40,6 +60,10 @@ TAG_LOGGER: bool = False
 
 TAG_LOGGER_THREAD_ID: int = int(getenv("TAG_LOGGER_THREAD_ID") or getenv("LOG_CHAT_THREAD_ID") or 0) or None
 
+TG_DOWNLOAD_CONCURRENCY: int = int(getenv("TG_DOWNLOAD_CONCURRENCY", 4))
+
+UPLOAD_CONCURRENCY: int = int(getenv("UPLOAD_CONCURRENCY", 3))
+
 UPSTREAM_REPO: str = getenv("UPSTREAM_REPO", "https://github.com/thedragonsinn/plain-ub")
 
 USE_LEGACY_KANG: int = int(getenv("USE_LEGACY_KANG", 0))
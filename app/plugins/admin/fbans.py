@@ -1,16 +1,60 @@
 import asyncio
 import re
+import time
+import uuid
+from collections import Counter, defaultdict
+from io import BytesIO
 
 from pyrogram import filters
 from pyrogram.types import Chat, User
 from ub_core.utils.helpers import get_name
 
 from app import BOT, Config, CustomDB, Message, bot, extra_config
+from app.rate_limit import RateLimiter, call_with_limit
 
-FBAN_TASK_LOCK = asyncio.Lock()
+FED_SEMAPHORE = asyncio.Semaphore(max(extra_config.FBAN_CONCURRENCY, 1))
+
+# chat_id -> pacer of the commands sent to that fed chat
+FED_LIMITERS: defaultdict[int, RateLimiter] = defaultdict(
+    lambda: RateLimiter(
+        rate=1 / extra_config.FBAN_CHAT_INTERVAL if extra_config.FBAN_CHAT_INTERVAL > 0 else 0, name="fed chat"
+    )
+)
 
 FED_DB = CustomDB["FED_LIST"]
 
+# chat_id -> fed, loaded on boot and written through by addf, addfb and delf
+FED_CACHE: dict[int, dict] = {}
+
+# chat_id -> task_type -> response filter for that fed
+FED_FILTERS: dict[int, dict[str, filters.Filter]] = {}
+
+FBAN_QUEUE = CustomDB["FBAN_QUEUE"]
+
+FED_STATS_DB = CustomDB["FED_STATS"]
+
+# chat_id -> rolling response stats of the fed
+FED_STATS: dict[int, dict] = {}
+
+# chat_ids of FED_STATS entries not yet saved to DB
+DIRTY_STATS: set[int] = set()
+
+# number of latency samples and run results kept per fed
+STATS_WINDOW = 50
+
+BASE_TIMEOUT = 8
+
+MAX_TIMEOUT = 30
+
+# job_id -> job, mirrors FBAN_QUEUE
+FBAN_JOBS: dict[str, dict] = {}
+
+# job_id -> progress message of jobs queued in this session
+PROGRESS_MESSAGES: dict[str, Message] = {}
+
+# Jobs interleave across feds but never talk to the same fed at once.
+FED_LOCKS: dict[int, asyncio.Lock] = defaultdict(asyncio.Lock)
+
 BASIC_FILTER = filters.user([609517172, 2059887769, 1376954911, 885745757]) & ~filters.service
 
 FBAN_REGEX = BASIC_FILTER & filters.regex(
@@ -27,6 +71,42 @@ FBAN_REGEX = BASIC_FILTER & filters.regex(
 
 UNFBAN_REGEX = BASIC_FILTER & filters.regex(r"(New un-FedBan|I'll give|Un-FedBan)", re.IGNORECASE)
 
+TASK_FILTERS: dict[str, filters.Filter] = {"Fban": FBAN_REGEX, "Un-FBan": UNFBAN_REGEX}
+
+
+async def init_task():
+    async for fed in FED_DB.find():
+        cache_fed(fed)
+
+    async for stats in FED_STATS_DB.find():
+        FED_STATS[int(stats["_id"])] = stats
+
+    async for job in FBAN_QUEUE.find():
+        # Jobs that were running when the bot stopped resume from their last finished fed.
+        job["status"] = "pending"
+        FBAN_JOBS[job["_id"]] = job
+
+
+def cache_fed(fed: dict) -> None:
+    chat_id = int(fed["_id"])
+
+    FED_CACHE.setdefault(chat_id, {}).update(fed)
+
+    if chat_id not in FED_FILTERS:
+        FED_FILTERS[chat_id] = {
+            task_type: filters.chat(chat_id) & task_filter for task_type, task_filter in TASK_FILTERS.items()
+        }
+
+
+def uncache_fed(chat_id: int | str | None = None) -> None:
+    if chat_id is None:
+        FED_CACHE.clear()
+        FED_FILTERS.clear()
+        return
+
+    FED_CACHE.pop(chat_id, None)
+    FED_FILTERS.pop(chat_id, None)
+
 
 @bot.add_cmd(cmd="addf")
 async def add_fed(bot: BOT, message: Message):
@@ -46,6 +126,8 @@ async def add_fed(bot: BOT, message: Message):
         f"\nTotal bots to wait for: {data['total_bots']}"
     )
 
+    cache_fed({"_id": message.chat.id, **data})
+
     await asyncio.gather(
         FED_DB.add_data({"_id": message.chat.id, **data}),
         message.reply(text=text, del_in=5),
@@ -68,6 +150,8 @@ async def set_bot_count(bot: BOT, message: Message):
         confirmation = (
             f"#FBANS\n<b>{message.chat.title}</b> [<code>{message.chat.id}</code>] bot count updated to: <b>{count}</b>"
         )
+        cache_fed({"_id": message.chat.id, "total_bots": count})
+
         await asyncio.gather(
             FED_DB.add_data({"_id": message.chat.id, "total_bots": count}),
             message.reply(confirmation, del_in=5),
@@ -87,6 +171,7 @@ async def remove_fed(bot: BOT, message: Message):
         .delf | .delf id | .delf -all
     """
     if "-all" in message.flags:
+        uncache_fed()
         await FED_DB.drop()
         await message.reply("FED LIST cleared.")
         return
@@ -100,6 +185,7 @@ async def remove_fed(bot: BOT, message: Message):
     elif chat.lstrip("-").isdigit():
         chat = int(chat)
 
+    uncache_fed(chat)
     deleted: int = await FED_DB.delete_data(id=chat)
 
     if deleted:
@@ -126,7 +212,7 @@ async def fed_list(bot: BOT, message: Message):
 
     total = 0
 
-    async for fed in FED_DB.find():
+    for fed in FED_CACHE.values():
         output_list.append(f"<b>• {fed['name']}</b>")
 
         if "-id" in message.flags:
@@ -193,11 +279,10 @@ async def fed_ban(bot: BOT, message: Message):
 
     fban_cmd: str = f"/fban <a href='tg://user?id={user_id}'>{user_id}</a> {reason}"
 
-    await perform_fed_task(
+    await queue_fed_task(
         user_id=user_id,
         user_mention=user_mention,
         command=fban_cmd,
-        task_filter=FBAN_REGEX,
         task_type="Fban",
         reason=reason,
         progress=progress,
@@ -226,11 +311,10 @@ async def un_fban(bot: BOT, message: Message):
     user_id, user_mention, reason = extracted_info
     unfban_cmd: str = f"/unfban <a href='tg://user?id={user_id}'>{user_id}</a> {reason}"
 
-    await perform_fed_task(
+    await queue_fed_task(
         user_id=user_id,
         user_mention=user_mention,
         command=unfban_cmd,
-        task_filter=UNFBAN_REGEX,
         task_type="Un-FBan",
         reason=reason,
         progress=progress,
@@ -238,6 +322,123 @@ async def un_fban(bot: BOT, message: Message):
     )
 
 
+@bot.add_cmd(cmd="fbanb")
+async def batch_fed_ban(bot: BOT, message: Message):
+    """
+    CMD: FBANB
+    INFO:
+        Fban a list of users in a single pass over the feds.
+        Every fed gets all the commands in one burst and the
+        bot responses are matched back to the users.
+    FLAGS:
+        -nrc: Don't do sudo fban
+    USAGE:
+        .fbanb uid1 uid2 @user3 reason
+        .fbanb [reply to a file containing user ids] reason
+        .fbanb [reply to a message mentioning users] reason
+    """
+    progress: Message = await message.reply("❯")
+
+    user_ids, reason = await get_batch_users(message)
+
+    protected = {Config.OWNER_ID, *Config.SUPERUSERS, *Config.SUDO_USERS}
+    user_ids = [user_id for user_id in user_ids if user_id not in protected]
+
+    if not user_ids:
+        await progress.edit("Unable to extract any users to Fban.")
+        return
+
+    await queue_fed_task(
+        user_id=None,
+        user_mention=f"<b>{len(user_ids)}</b> users",
+        command=f"/fbanb {' '.join(map(str, user_ids))} {reason}",
+        task_type="Fban",
+        reason=reason,
+        progress=progress,
+        message=message,
+        user_ids=user_ids,
+        commands=[f"/fban <a href='tg://user?id={user_id}'>{user_id}</a> {reason}" for user_id in user_ids],
+    )
+
+
+@bot.add_cmd(cmd="fbq")
+async def fed_queue(bot: BOT, message: Message):
+    """
+    CMD: FBQ
+    INFO: View queued and running Fban/Un-Fban tasks.
+    USAGE: .fbq
+    """
+    jobs = get_sorted_jobs()
+
+    if not jobs:
+        await message.reply("Fed queue is empty.", del_in=8)
+        return
+
+    output_list: list[str] = [f"<b>{len(jobs)}</b> task(s) in Fed queue:\n"]
+
+    for job in jobs:
+        total = job["total"] or "?"
+        output_list.append(
+            f"<b>• {job['task_type']}</b> {job['user_mention']} [<code>{job['_id']}</code>]"
+            f"\n  {job['status']}: {len(job['done'])} / {total} feds, {len(job['failed'])} failed"
+        )
+
+    await message.reply("\n".join(output_list), del_in=30, block=True)
+
+
+@bot.add_cmd(cmd="fedstats")
+async def fed_stats(bot: BOT, message: Message):
+    """
+    CMD: FEDSTATS
+    INFO: View response latency and failure rate of connected feds.
+    FLAGS:
+        -r: reset stats of all feds.
+    USAGE: .fedstats | .fedstats -r
+    """
+    if "-r" in message.flags:
+        FED_STATS.clear()
+        DIRTY_STATS.clear()
+        await FED_STATS_DB.drop()
+        await message.reply("Fed stats cleared.", del_in=8)
+        return
+
+    output_list: list[str] = []
+
+    for chat_id, fed in FED_CACHE.items():
+        stats = FED_STATS.get(chat_id)
+
+        if not stats or not stats["results"]:
+            output_list.append(f"<b>• {fed['name']}</b>\n  no data")
+            continue
+
+        latencies = stats["latencies"]
+        results = stats["results"]
+        failure_rate = results.count(False) * 100 / len(results)
+
+        if latencies:
+            latency_str = f"p50 {percentile(latencies, 50):.1f}s | p95 {percentile(latencies, 95):.1f}s"
+        else:
+            latency_str = "no responses"
+
+        errors = ", ".join(f"{error}: {count}" for error, count in stats["errors"].items())
+        dead = " [skipped]" if is_fed_dead(chat_id) else ""
+
+        output_list.append(
+            f"<b>• {fed['name']}</b>{dead}"
+            f"\n  {latency_str} | failed {failure_rate:.0f}% of {len(results)}"
+            f"\n  timeouts: {stats['timeouts']} | reason updates: {stats['clicks']}"
+            + (f"\n  errors: {errors}" if errors else "")
+        )
+
+    if not output_list:
+        await message.reply("You don't have any Feds Connected.")
+        return
+
+    output_list.insert(0, f"Stats of <b>{len(output_list)}</b> Connected Feds:\n")
+
+    await message.reply("\n".join(output_list), del_in=60, block=True)
+
+
 async def get_user_reason(message: Message, progress: Message) -> tuple[int, str, str] | None:
     user, reason = await message.extract_user_n_reason()
     if isinstance(user, str):
@@ -252,85 +453,433 @@ async def get_user_reason(message: Message, progress: Message) -> tuple[int, str
     return user_id, user_mention, reason
 
 
-async def perform_fed_task(*args, **kwargs):
-    async with FBAN_TASK_LOCK:
-        await _perform_fed_task(*args, **kwargs)
+async def get_batch_users(message: Message) -> tuple[list[int], str]:
+    replied = message.replied
+    reason = message.filtered_input
+    usernames: list[str] = []
+
+    if replied and replied.document:
+        file = await replied.download(in_memory=True)
+        user_ids = [int(user_id) for user_id in re.findall(r"\b\d{5,}\b", file.getvalue().decode(errors="ignore"))]
+
+    elif replied:
+        entities = replied.entities or replied.caption_entities or []
+        user_ids = [entity.user.id for entity in entities if entity.user]
+        usernames = re.findall(r"@(\w{4,32})", replied.text or replied.caption or "")
 
+    else:
+        tokens = reason.split()
+        users = []
+        while tokens and (tokens[0].isdigit() or tokens[0].startswith("@")):
+            users.append(tokens.pop(0))
+
+        reason = " ".join(tokens)
+        user_ids = [int(user) for user in users if user.isdigit()]
+        usernames = [user.lstrip("@") for user in users if not user.isdigit()]
+
+    for username in usernames:
+        try:
+            user_ids.append((await bot.get_users(username)).id)
+        except Exception:
+            continue
+
+    return list(dict.fromkeys(user_ids)), reason
 
-async def _perform_fed_task(
+
+async def queue_fed_task(
     user_id: int,
     user_mention: str,
     command: str,
-    task_filter: filters.Filter,
     task_type: str,
     reason: str,
     progress: Message,
     message: Message,
-):
-    await progress.edit("❯❯")
+    user_ids: list[int] | None = None,
+    commands: list[str] | None = None,
+) -> dict:
+    job_data = dict(
+        user_id=user_id,
+        user_mention=user_mention,
+        command=command,
+        # batch jobs send one command per user to every fed
+        batch=user_ids is not None,
+        user_ids=user_ids or [user_id],
+        commands=commands or [command],
+        task_type=task_type,
+        reason=reason,
+        initiated_in=message.chat.title or "PM",
+        by=None if message.is_from_owner else get_name(message.from_user),
+        sudo_fban="-nrc" not in message.flags,
+        progress_chat=progress.chat.id,
+        progress_id=progress.id,
+        done=[],
+        failed=[],
+        failed_users={},
+        total=0,
+    )
 
-    total: int = 0
-    failed_bans: list[str] = []
+    # A pending job for the same user is replaced by the latest request.
+    old_progress = None
+    for job in get_sorted_jobs():
+        if user_id is not None and job["user_id"] == user_id and job["status"] == "pending":
+            old_progress = PROGRESS_MESSAGES.pop(job["_id"], None)
+            break
+    else:
+        job = dict(_id=uuid.uuid4().hex[:8], status="pending", created=time.time())
 
-    async for fed in FED_DB.find():
-        chat_id = int(fed["_id"])
-        total += 1
-        fed_name = fed["name"]
-        try:
-            async with bot.Convo(client=bot, chat_id=chat_id, timeout=8, filters=task_filter) as convo:
-                await convo.send_message(text=command, disable_preview=True)
+    # updated before any await so the worker can't start the job with the old data in between
+    job.update(job_data)
+    FBAN_JOBS[job["_id"]] = job
+    PROGRESS_MESSAGES[job["_id"]] = progress
 
-                coroutines = (convo.get_response() for _ in range(0, fed.get("total_bots", 1)))
+    if old_progress:
+        await old_progress.edit("Merged into a newer request.", del_in=5)
 
-                bot_responses: tuple[Message | None] = await asyncio.gather(*coroutines, return_exceptions=True)
+    await FBAN_QUEUE.add_data(job)
 
-                for msg in bot_responses:
-                    if isinstance(msg, Message):
-                        if "Would you like to update this reason" in msg.text:
-                            await msg.click("Update reason")
+    position = [j["_id"] for j in get_sorted_jobs()].index(job["_id"]) + 1
+    await progress.edit(f"❯ Queued <b>{task_type}</b> [<code>{job['_id']}</code>] at position {position}.")
+    return job
 
-                        continue
 
-                    if fed_name not in failed_bans:
-                        failed_bans.append(fed_name)
+def get_sorted_jobs() -> list[dict]:
+    return sorted(FBAN_JOBS.values(), key=lambda j: j["created"])
 
-        except Exception as e:
-            await bot.log_text(
-                text=f"An Error occurred while banning in fed: {fed_name} [{chat_id}]\nError: {e}",
-                type=task_type.upper(),
-            )
-            failed_bans.append(fed_name)
-            continue
 
-        await asyncio.sleep(1)
+async def fban_queue_worker():
+    job = next((j for j in get_sorted_jobs() if j["status"] == "pending"), None)
+
+    if not job:
+        return
+
+    job["status"] = "running"
+    await FBAN_QUEUE.add_data({"_id": job["_id"], "status": "running"})
+
+    try:
+        await perform_fed_task(job)
+    except asyncio.CancelledError:
+        # Bot is shutting down, leave the job in DB to resume on next boot.
+        job["status"] = "pending"
+        raise
+    except Exception as e:
+        bot.log.error(f"Fed task {job['_id']} failed: {e}", exc_info=True)
+
+    FBAN_JOBS.pop(job["_id"], None)
+    PROGRESS_MESSAGES.pop(job["_id"], None)
+    await FBAN_QUEUE.delete_data(id=job["_id"])
+
+
+for _worker in range(max(extra_config.FBAN_WORKERS, 1)):
+    BOT.register_worker(interval=2, name=f"fban-queue-worker-{_worker}")(fban_queue_worker)
+
+
+async def get_job_progress(job: dict) -> Message | None:
+    progress = PROGRESS_MESSAGES.get(job["_id"])
+    if progress:
+        return progress
+
+    # Job restored from DB after a restart.
+    try:
+        progress = await bot.get_messages(chat_id=job["progress_chat"], message_ids=job["progress_id"])
+    except Exception:
+        return None
+
+    if not progress or progress.empty:
+        return None
+
+    progress = Message(message=progress)
+    PROGRESS_MESSAGES[job["_id"]] = progress
+    return progress
+
+
+async def perform_fed_task(job: dict):
+    progress = await get_job_progress(job)
+
+    if progress:
+        await progress.edit("❯❯")
+
+    feds: list[dict] = list(FED_CACHE.values())
+    total: int = len(feds)
+    failed_bans: list[str] = job["failed"]
+
+    job["total"] = total
+
+    await asyncio.gather(*(fed_task(fed=fed, job=job) for fed in feds if int(fed["_id"]) not in job["done"]))
 
     if not total:
-        await progress.edit("You Don't have any feds connected!")
+        if progress:
+            await progress.edit("You Don't have any feds connected!")
         return
 
+    task_type = job["task_type"]
+
+    if job.get("batch"):
+        task_status, log_text = get_batch_status(job=job, total=total)
+    else:
+        task_status = (
+            f"❯❯❯ <b>{task_type}ned</b> {job['user_mention']}"
+            f"\n<b>ID</b>: {job['user_id']}"
+            f"\n<b>Reason</b>: {job['reason']}"
+            f"\n<b>Initiated in</b>: {job['initiated_in']}"
+        )
+
+        if failed_bans:
+            task_status += f"\n<b>Failed</b in>: {len(failed_bans)} / {total}"
+        else:
+            task_status += f"\n<b>{task_type}ned</b in>: <b>{total}</b> feds"
+
+        log_text = task_status + (("\n• " + "\n• ".join(failed_bans)) if failed_bans else "")
+
+    sudo = f"\n\n<b>By</b>: {job['by']}" if job["by"] else ""
+
+    if len(log_text + sudo) > 4096:
+        report = BytesIO(re.sub(r"<[^>]+>", "", log_text + sudo).encode())
+        report.name = f"{task_type.lower()}_{job['_id']}.txt"
+        await bot.send_document(chat_id=extra_config.FBAN_LOG_CHANNEL, document=report, caption=task_status[:1024])
+    else:
+        await bot.send_message(chat_id=extra_config.FBAN_LOG_CHANNEL, text=log_text + sudo, disable_preview=True)
+
+    if progress:
+        await progress.edit(text=task_status + sudo, del_in=5, block=True, disable_preview=True)
+
+    if job["sudo_fban"]:
+        await handle_sudo_fban(command=job["command"])
+
+
+def get_batch_status(job: dict, total: int) -> tuple[str, str]:
+    """
+    :return: Short status for the progress message and a per-user report for logs.
+    """
+    task_type = job["task_type"]
+    user_ids = job["user_ids"]
+    failed_users: dict[str, list[str]] = job["failed_users"]
+
     task_status = (
-        f"❯❯❯ <b>{task_type}ned</b> {user_mention}"
-        f"\n<b>ID</b>: {user_id}"
-        f"\n<b>Reason</b>: {reason}"
-        f"\n<b>Initiated in</b>: {message.chat.title or 'PM'}"
+        f"❯❯❯ <b>Batch {task_type}ned</b> {job['user_mention']}"
+        f"\n<b>Reason</b>: {job['reason']}"
+        f"\n<b>Initiated in</b>: {job['initiated_in']}"
+        f"\n<b>Feds</b>: {total - len(job['failed'])} / {total} clean"
+        f"\n<b>Users</b>: {len(user_ids) - len(failed_users)} / {len(user_ids)} {task_type.lower()}ned in all feds"
     )
 
-    if failed_bans:
-        task_status += f"\n<b>Failed</b in>: {len(failed_bans)} / {total}"
+    report: list[str] = [task_status, ""]
+
+    for user_id in user_ids:
+        failed_in = failed_users.get(str(user_id))
+        if failed_in:
+            report.append(f"• <code>{user_id}</code>: failed in {len(failed_in)}: {', '.join(failed_in)}")
+        else:
+            report.append(f"• <code>{user_id}</code>: done")
+
+    return task_status, "\n".join(report)
+
+
+async def fed_task(fed: dict, job: dict) -> None:
+    chat_id = int(fed["_id"])
+    fed_name = fed["name"]
+    task_type = job["task_type"]
+    total_bots = fed.get("total_bots", 1)
+    user_ids: list[int] = job.get("user_ids") or [job["user_id"]]
+    failed_bans: list[str] = job["failed"]
+    failed_users: set[int] = set(user_ids)
+
+    if is_fed_dead(chat_id):
+        failed_bans.append(f"{fed_name} (skipped: not responding)")
+
     else:
-        task_status += f"\n<b>{task_type}ned</b in>: <b>{total}</b> feds"
+        async with FED_LOCKS[chat_id], FED_SEMAPHORE:
+            commands: list[str] = job.get("commands") or [job["command"]]
+            latencies: list[float] = []
+            answered = False
+            clicks = 0
+            errors: list[str] = []
+
+            try:
+                bot_responses = await send_fed_commands(
+                    chat_id=chat_id,
+                    commands=commands,
+                    task_filter=FED_FILTERS.get(chat_id, TASK_FILTERS)[task_type],
+                    total_bots=total_bots,
+                    timeout=get_fed_timeout(chat_id),
+                    # replies buffered during a batch burst would look instant, keep them out of the stats
+                    latencies=latencies if len(commands) == 1 else None,
+                )
+
+                confirmations: dict[int, int] = defaultdict(int)
+
+                for msg in bot_responses:
+                    if not isinstance(msg, Message):
+                        errors.append(type(msg).__name__)
+                        continue
+
+                    answered = True
+
+                    if "Would you like to update this reason" in msg.text:
+                        await msg.click("Update reason")
+                        clicks += 1
+
+                    for user_id in match_response_users(response=msg, user_ids=user_ids):
+                        confirmations[user_id] += 1
+
+                failed_users = {user_id for user_id in user_ids if confirmations[user_id] < total_bots}
+
+            except Exception as e:
+                errors.append(type(e).__name__)
+                await bot.log_text(
+                    text=f"An Error occurred while banning in fed: {fed_name} [{chat_id}]\nError: {e}",
+                    type=task_type.upper(),
+                )
+
+            if len(commands) > 1:
+                # a batch waits on every bot once per user, count its errors once per bot like a single run
+                errors = [
+                    error for error, count in Counter(errors).items() for _ in range(-(-count // len(commands)))
+                ]
+
+            record_fed_stats(
+                chat_id=chat_id,
+                success=not failed_users,
+                answered=answered,
+                latencies=latencies,
+                clicks=clicks,
+                errors=errors,
+            )
+
+        if failed_users and fed_name not in failed_bans:
+            failed_bans.append(fed_name)
+
+    for user_id in failed_users:
+        job.setdefault("failed_users", {}).setdefault(str(user_id), []).append(fed_name)
+
+    job["done"].append(chat_id)
+    await FBAN_QUEUE.add_data(
+        {
+            "_id": job["_id"],
+            "done": job["done"],
+            "failed": failed_bans,
+            "failed_users": job.get("failed_users", {}),
+            "total": job["total"],
+        }
+    )
 
-    failed = ("\n• " + "\n• ".join(failed_bans)) if failed_bans else ""
-    sudo = f"\n\n<b>By</b>: {get_name(message.from_user)}" if not message.is_from_owner else ""
 
-    await bot.send_message(
-        chat_id=extra_config.FBAN_LOG_CHANNEL, text=task_status + failed + sudo, disable_preview=True
+def get_fed_stats(chat_id: int) -> dict:
+    return FED_STATS.setdefault(
+        chat_id, dict(_id=chat_id, latencies=[], results=[], timeouts=0, clicks=0, errors={}, dead_runs=0)
     )
 
-    await progress.edit(text=task_status + sudo, del_in=5, block=True, disable_preview=True)
 
-    if "-nrc" not in message.flags:
-        await handle_sudo_fban(command=command)
+def record_fed_stats(
+    chat_id: int, success: bool, answered: bool, latencies: list[float], clicks: int, errors: list[str]
+) -> None:
+    stats = get_fed_stats(chat_id)
+
+    stats["latencies"] = (stats["latencies"] + [round(latency, 2) for latency in latencies])[-STATS_WINDOW:]
+    stats["results"] = (stats["results"] + [success])[-STATS_WINDOW:]
+    stats["clicks"] += clicks
+
+    for error in errors:
+        if error == "TimeoutError":
+            stats["timeouts"] += 1
+        else:
+            stats["errors"][error] = stats["errors"].get(error, 0) + 1
+
+    # a run is dead when none of the fed's bots answered
+    stats["dead_runs"] = 0 if answered else stats["dead_runs"] + 1
+    stats["last_run"] = time.time()
+
+    DIRTY_STATS.add(chat_id)
+
+
+def is_fed_dead(chat_id: int) -> bool:
+    """
+    A dead fed is still tried once every FBAN_DEAD_RETRY minutes,
+    so it's used again as soon as one of its bots answers.
+    """
+    dead_runs = extra_config.FBAN_DEAD_RUNS
+    stats = FED_STATS.get(chat_id, {})
+
+    if not dead_runs or stats.get("dead_runs", 0) < dead_runs:
+        return False
+
+    return time.time() - stats.get("last_run", 0) < extra_config.FBAN_DEAD_RETRY * 60
+
+
+def get_fed_timeout(chat_id: int) -> float:
+    """
+    Slow feds get up to MAX_TIMEOUT seconds based on their p95 latency.
+    """
+    latencies = FED_STATS.get(chat_id, {}).get("latencies")
+
+    if not latencies:
+        return BASE_TIMEOUT
+
+    return min(max(BASE_TIMEOUT, percentile(latencies, 95) * 1.5), MAX_TIMEOUT)
+
+
+def percentile(values: list[float], percent: int) -> float:
+    values = sorted(values)
+    index = max(round(len(values) * percent / 100) - 1, 0)
+    return values[min(index, len(values) - 1)]
+
+
+@BOT.register_worker(interval=60, name="fed-stats-worker")
+async def fed_stats_worker():
+    while DIRTY_STATS:
+        chat_id = DIRTY_STATS.pop()
+        await FED_STATS_DB.add_data(FED_STATS[chat_id])
+
+
+def match_response_users(response: Message, user_ids: list[int]) -> set[int]:
+    """
+    Match a fed bot's response to the users it is about
+    using the IDs in its text and the users in its mentions.
+    """
+    if len(user_ids) == 1:
+        return set(user_ids)
+
+    text = response.text or ""
+
+    for entity in response.entities or []:
+        if entity.user:
+            text += f" {entity.user.id}"
+        elif entity.url:
+            text += f" {entity.url}"
+
+    found = {int(user_id) for user_id in re.findall(r"\d{5,}", text)}
+    return found.intersection(user_ids)
+
+
+async def send_fed_commands(
+    chat_id: int,
+    commands: list[str],
+    task_filter: filters.Filter,
+    total_bots: int = 1,
+    timeout: float = BASE_TIMEOUT,
+    latencies: list[float] | None = None,
+) -> list[Message | BaseException]:
+    """
+    Sends all commands in the fed chat in one burst and waits for total_bots responses to each.
+    Seconds taken by each response after the burst are appended to latencies,
+    only meaningful for a single command as replies to a long burst pile up while it's sent.
+    """
+    # give bots a bit more time to go through long bursts
+    timeout += len(commands) - 1
+
+    async with bot.Convo(client=bot, chat_id=chat_id, timeout=timeout, filters=task_filter) as convo:
+        for command in commands:
+            await call_with_limit(FED_LIMITERS[chat_id], lambda: convo.send_message(text=command, disable_preview=True))
+
+        sent_at = time.monotonic()
+
+        async def get_response() -> Message:
+            response = await convo.get_response()
+            if latencies is not None:
+                latencies.append(time.monotonic() - sent_at)
+            return response
+
+        coroutines = (get_response() for _ in range(0, total_bots * len(commands)))
+        return await asyncio.gather(*coroutines, return_exceptions=True)
 
 
 async def handle_sudo_fban(command: str):
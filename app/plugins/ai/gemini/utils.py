@@ -1,6 +1,5 @@
 import asyncio
 import io
-import os.path
 import pathlib
 import shutil
 from functools import wraps
@@ -11,6 +10,7 @@ from ub_core.utils import get_tg_media_details
 
 from app import BOT, Config, Message, extra_config
 from app.plugins.ai.gemini import async_client
+from app.plugins.files.cache import media_cache
 
 
 def run_basic_check(function):
@@ -52,12 +52,12 @@ async def upload_tg_file(message: Message, check_size: bool = True, client=async
     download_dir = None
     try:
         if getattr(media, "file_size", 0) < 500_000:
-            downloaded_file: io.BytesIO = await message.download(in_memory=True)
+            downloaded_file: io.BytesIO = await media_cache.read_tg(message)
             file_name = downloaded_file.name
         else:
             download_dir = Config.TEMP_DOWNLOAD_PATH().as_posix() + "/"
-            downloaded_file: str = await message.download(download_dir)
-            file_name = os.path.basename(downloaded_file)
+            downloaded_file: pathlib.Path = await media_cache.download_tg(message, download_dir)
+            file_name = downloaded_file.name
 
         return await upload_file(downloaded_file, file_name, client)
     finally:
@@ -0,0 +1,218 @@
+import asyncio
+import hashlib
+import json
+import os
+import shutil
+import time
+from collections import defaultdict
+from collections.abc import Awaitable, Callable
+from io import BytesIO
+from pathlib import Path
+
+from ub_core.utils import Download, DownloadedFile, get_tg_media_details
+
+from app import Message, bot, extra_config
+
+
+class MediaCache:
+    """
+    On-disk cache of downloaded media keyed by TG file_unique_id or URL + ETag.
+    Callers get hardlinks into their own dirs, so deleting those never touches the cache.
+    Entries expire after ttl seconds and least recently used ones are evicted past max_bytes.
+    """
+
+    def __init__(self, root: Path, max_bytes: int, ttl: int):
+        self.root = root
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.index_file = root / "index.json"
+        # key hash -> {path, size, created, accessed}
+        self.entries: dict[str, dict] = {}
+        self.locks: defaultdict[str, asyncio.Lock] = defaultdict(asyncio.Lock)
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_bytes > 0
+
+    def load(self):
+        if not self.enabled:
+            return
+
+        self.root.mkdir(parents=True, exist_ok=True)
+
+        if self.index_file.is_file():
+            with open(self.index_file) as file:
+                self.entries = json.load(file)
+
+        # drop entries whose files were removed by hand
+        self.entries = {key: entry for key, entry in self.entries.items() if os.path.isfile(entry["path"])}
+        self.evict()
+
+    def save(self):
+        with open(self.index_file, "w") as file:
+            json.dump(self.entries, file)
+
+    @staticmethod
+    def hash_key(key: str) -> str:
+        return hashlib.sha1(key.encode()).hexdigest()
+
+    def get(self, key: str) -> Path | None:
+        entry = self.entries.get(self.hash_key(key))
+
+        if not entry:
+            return None
+
+        if time.time() - entry["created"] > self.ttl or not os.path.isfile(entry["path"]):
+            self.remove(self.hash_key(key))
+            return None
+
+        entry["accessed"] = time.time()
+        return Path(entry["path"])
+
+    def add(self, key: str, path: Path | str) -> Path | None:
+        """
+        Links path into the cache under key.
+        :return: The cached copy's path, None if the file is too big to cache.
+        """
+        if os.path.getsize(path) > self.max_bytes:
+            return None
+
+        key_hash = self.hash_key(key)
+        cache_dir = self.root / key_hash
+        cache_dir.mkdir(parents=True, exist_ok=True)
+        cached_path = self.link(path, cache_dir / os.path.basename(path))
+
+        now = time.time()
+        self.entries[key_hash] = dict(
+            path=str(cached_path), size=os.path.getsize(cached_path), created=now, accessed=now
+        )
+        self.evict(keep=key_hash)
+        return cached_path
+
+    def remove(self, key_hash: str):
+        entry = self.entries.pop(key_hash, None)
+        if entry:
+            shutil.rmtree(self.root / key_hash, ignore_errors=True)
+
+    def evict(self, keep: str = None):
+        """
+        :param keep: Key hash of an entry that must survive, like the one just added.
+        """
+        now = time.time()
+
+        for key_hash, entry in list(self.entries.items()):
+            if now - entry["created"] > self.ttl and key_hash != keep:
+                self.remove(key_hash)
+
+        total = sum(entry["size"] for entry in self.entries.values())
+
+        for key_hash, entry in sorted(self.entries.items(), key=lambda item: item[1]["accessed"]):
+            if total <= self.max_bytes:
+                break
+            if key_hash == keep:
+                continue
+            total -= entry["size"]
+            self.remove(key_hash)
+
+        self.save()
+
+    @staticmethod
+    def link(source: Path | str, dest: Path | str) -> Path:
+        dest = Path(dest)
+        dest.parent.mkdir(parents=True, exist_ok=True)
+
+        if dest.exists():
+            dest.unlink()
+
+        try:
+            os.link(source, dest)
+        except OSError:
+            # different filesystem or no hardlink support
+            shutil.copy2(source, dest)
+
+        return dest
+
+    async def download_tg(
+        self, message: Message, dest_dir: Path | str, file_name: str = None, **download_kwargs
+    ) -> Path:
+        """
+        Telegram media from the cache, downloaded into it on a miss, linked into dest_dir.
+        :param file_name: Name in dest_dir, defaults to the name pyrogram gives the file.
+        :param download_kwargs: Passed to message.download, like progress and progress_args.
+        """
+        if not self.enabled:
+            path = Path(dest_dir) / file_name if file_name else str(dest_dir).rstrip("/") + "/"
+            return Path(await message.download(file_name=str(path), **download_kwargs))
+
+        key = f"tg:{get_tg_media_details(message).file_unique_id}"
+
+        async with self.locks[key]:
+            # linked right away, with no await in between nothing can evict it first
+            if cached := self.get(key):
+                return self.link(cached, Path(dest_dir) / (file_name or cached.name))
+
+            temp_dir = self.root / f"tmp_{self.hash_key(key)}"
+            try:
+                path = Path(await message.download(file_name=f"{temp_dir}/", **download_kwargs))
+                # files bigger than the whole cache aren't added but still reach dest
+                self.add(key, path)
+                return self.link(path, Path(dest_dir) / (file_name or path.name))
+            finally:
+                shutil.rmtree(temp_dir, ignore_errors=True)
+
+    async def read_tg(self, message: Message) -> BytesIO:
+        """
+        :return: Telegram media in memory, the same way message.download(in_memory=True) does.
+        """
+        if not self.enabled:
+            return await message.download(in_memory=True)
+
+        # read from a private link so eviction during the read can't remove the file
+        read_dir = self.root / f"read_{time.time_ns()}"
+        try:
+            path = await self.download_tg(message, read_dir)
+            file = BytesIO(await asyncio.to_thread(path.read_bytes))
+            file.name = path.name
+            return file
+        finally:
+            shutil.rmtree(read_dir, ignore_errors=True)
+
+    async def download_url(
+        self, dl_obj: Download, dest: Path, download: Callable[[], Awaitable[DownloadedFile]]
+    ) -> DownloadedFile:
+        """
+        Serves the URL from cache if its ETag matches a cached copy,
+        otherwise runs download and caches the result.
+        :param dest: Where the file would be downloaded to.
+        """
+        etag = dl_obj.file_response_session.headers.get("ETag")
+
+        # without a validator there's no way to know the content didn't change
+        if not self.enabled or not etag:
+            return await download()
+
+        key = f"url:{dl_obj.file_response_session.url}:{etag}"
+
+        async with self.locks[key]:
+            if cached := self.get(key):
+                return DownloadedFile(file=self.link(cached, dest))
+
+            file = await download()
+            # skipped for files bigger than the cache, the download is at dest either way
+            self.add(key, file.path)
+            return file
+
+
+media_cache = MediaCache(
+    root=Path("downloads", "media_cache"),
+    max_bytes=extra_config.MEDIA_CACHE_SIZE * 1024 * 1024,
+    ttl=extra_config.MEDIA_CACHE_TTL * 3600,
+)
+
+
+async def init_task():
+    try:
+        await asyncio.to_thread(media_cache.load)
+    except Exception as e:
+        bot.log.error(f"Media cache reset: {e}")
+        media_cache.entries = {}
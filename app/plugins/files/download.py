@@ -1,10 +1,37 @@
 import asyncio
+import json
+import os
+import re
 import time
+from collections import defaultdict
+from datetime import datetime
+from functools import partial
 from pathlib import Path
 
 from ub_core.utils import Download, DownloadedFile, get_filename_from_mime, get_tg_media_details, progress
 
-from app import BOT, Message, bot, Config
+from app import BOT, Message, bot, Config, extra_config
+from app.plugins.files.cache import media_cache
+from app.plugins.files.ranged import ranged_download
+
+MIB = 1024 * 1024
+
+# segments smaller than this aren't worth a separate connection
+MIN_SEGMENT_SIZE = 4 * MIB
+
+# t.me/c/123/100-250, t.me/channel/100-250 or just t.me/channel
+TG_LINK_REGEX = re.compile(
+    r"https://t\.me/(?:c/(?P<chat_id>\d+)|(?P<username>\w+))(?:/(?P<start>\d+)(?:-(?P<end>\d+))?)?/?$"
+)
+
+MEDIA_TYPE_FLAGS = {"-photo": "photo", "-video": "video", "-doc": "document", "-audio": "audio"}
+
+
+async def init_task():
+    # done once before any download holds the client's semaphore, swapping it later would break its bound
+    for client in (bot, getattr(bot, "bot", None)):
+        if client:
+            widen_transmissions(client, extra_config.TG_DOWNLOAD_CONCURRENCY)
 
 
 @bot.add_cmd(cmd="download")
@@ -12,10 +39,18 @@ async def down_load(bot: BOT, message: Message):
     """
     CMD: DOWNLOAD
     INFO: Download Files/TG Media to Bot server.
-    FLAGS: "-f" for custom filename
+    FLAGS:
+        -f: custom filename
+        -x: split URL downloads into N parallel connections
+        -photo, -video, -doc, -audio: media types to fetch from a channel
     USAGE:
         .download URL | Reply to Media
         .download -f file.ext URL | Reply to Media
+        .download -x 8 URL
+        .download -x 8 -f file.ext URL
+        .download [reply to an album]
+        .download https://t.me/c/123/100-250
+        .download -video -doc https://t.me/channel [since YYYY-MM-DD] [until YYYY-MM-DD]
     """
     response = await message.reply("Checking Input...")
 
@@ -28,6 +63,15 @@ async def down_load(bot: BOT, message: Message):
 
     await response.edit("Input verified....Starting Download...")
 
+    try:
+        batch = await get_batch_messages(message)
+    except Exception as e:
+        await response.edit(str(e))
+        return
+
+    if batch is not None:
+        return await batch_download(messages=batch, response=response, dir_name=download_dir)
+
     file_name = None
     dl_obj: None = None
 
@@ -41,11 +85,15 @@ async def down_load(bot: BOT, message: Message):
         )
 
     else:
+        url = message.filtered_input
+        connections = 1
+
+        if "-x" in message.flags:
+            connections, url = url.split(maxsplit=1)
+            connections = int(connections)
 
         if "-f" in message.flags:
-            file_name, url = message.filtered_input.split(maxsplit=1)
-        else:
-            url = message.filtered_input
+            file_name, url = url.split(maxsplit=1)
 
         if url.startswith("https://t.me/"):
             download_coro = telegram_download(
@@ -55,7 +103,19 @@ async def down_load(bot: BOT, message: Message):
             dl_obj: Download = await Download.setup(
                 url=url, dir=download_dir, message_to_edit=response, custom_file_name=file_name
             )
-            download_coro = dl_obj.download()
+            if connections > 1:
+                download_func = partial(
+                    segmented_download,
+                    dl_obj=dl_obj,
+                    url=url,
+                    dir_name=download_dir,
+                    connections=connections,
+                    response=response,
+                )
+            else:
+                download_func = dl_obj.download
+
+            download_coro = media_cache.download_url(dl_obj, download_dir / dl_obj.file_name, download_func)
 
     try:
         downloaded_file: DownloadedFile = await download_coro
@@ -98,5 +158,177 @@ async def telegram_download(
 
     progress_args = (response, "Downloading...", media_obj.path)
 
-    await message.download(file_name=media_obj.path, progress=progress, progress_args=progress_args)
+    await media_cache.download_tg(
+        message, dir_name, file_name=file_name, progress=progress, progress_args=progress_args
+    )
     return media_obj
+
+
+async def segmented_download(
+    dl_obj: Download, url: str, dir_name: Path, connections: int, response: Message
+) -> DownloadedFile:
+    """
+    Splits the file into Range requests over N pooled connections,
+    each writing its part into a preallocated sparse file with pwrite.
+    Falls back to dl_obj's single stream if the server doesn't support ranges.
+    """
+    size = dl_obj.size_bytes
+    accepts_ranges = dl_obj.file_response_session.headers.get("Accept-Ranges", "").lower() == "bytes"
+
+    if not size or not accepts_ranges or size < MIN_SEGMENT_SIZE * 2:
+        return await dl_obj.download()
+
+    path = dir_name / dl_obj.file_name
+    segment_size = max(-(-size // connections), MIN_SEGMENT_SIZE)
+    state = {"downloaded": 0}
+
+    # the probe response isn't needed anymore, free its connection
+    dl_obj.file_response_session.close()
+
+    progress_task = asyncio.create_task(
+        segment_progress(state, size, response, f"Downloading with {connections} connections..."),
+        name="segment_dl_prog",
+    )
+
+    try:
+        await ranged_download(url=url, path=path, size=size, part_size=segment_size, state=state)
+    finally:
+        progress_task.cancel()
+
+    if state["downloaded"] != size or os.path.getsize(path) != size:
+        raise Exception(f"Size mismatch: expected {size} bytes, got {state['downloaded']}.")
+
+    return DownloadedFile(file=path)
+
+
+async def segment_progress(state: dict, size: int, response: Message, action_str: str):
+    while True:
+        await progress(current_size=state["downloaded"], total_size=size, response=response, action_str=action_str)
+        await asyncio.sleep(5)
+
+
+async def get_batch_messages(message: Message) -> list[Message] | None:
+    """
+    :return: Media messages from a replied album, a t.me range or a channel link,
+        None if the input is a single file.
+    """
+    if message.replied and message.replied.media_group_id and "-f" not in message.flags:
+        return await message.replied.get_media_group()
+
+    link_and_dates = message.filtered_input.split()
+    link = TG_LINK_REGEX.match(link_and_dates[0]) if link_and_dates else None
+
+    if not link or (link["start"] and not link["end"]):
+        return None
+
+    chat_id = int(f"-100{link['chat_id']}") if link["chat_id"] else link["username"]
+
+    if link["end"]:
+        message_ids = list(range(int(link["start"]), int(link["end"]) + 1))
+        messages = []
+        # get_messages takes up to 200 ids per call
+        for index in range(0, len(message_ids), 200):
+            messages.extend(await message._client.get_messages(chat_id, message_ids[index : index + 200]))
+        return [msg for msg in messages if msg and not msg.empty and msg.media]
+
+    dates = [datetime.strptime(date, "%Y-%m-%d") for date in link_and_dates[1:3]]
+    since = dates[0] if dates else None
+    # history is walked newest first, starting from until
+    history_kwargs = {"offset_date": dates[1]} if len(dates) == 2 else {}
+    media_types = [media for flag, media in MEDIA_TYPE_FLAGS.items() if flag in message.flags]
+    messages = []
+
+    async for msg in message._client.get_chat_history(chat_id, **history_kwargs):
+        if since and msg.date < since:
+            break
+        if not msg.media or (media_types and not any(getattr(msg, media, None) for media in media_types)):
+            continue
+        messages.append(msg)
+
+    return messages[::-1]
+
+
+async def batch_download(messages: list[Message], response: Message, dir_name: Path) -> list[DownloadedFile]:
+    """
+    Fetches messages TG_DOWNLOAD_CONCURRENCY at a time with one aggregate progress message
+    and writes a manifest.json of what was downloaded into dir_name.
+    """
+    if not messages:
+        await response.edit("No media found.")
+        return []
+
+    semaphore = asyncio.Semaphore(extra_config.TG_DOWNLOAD_CONCURRENCY)
+
+    state = {"downloaded": defaultdict(int), "done": 0}
+    total_size = sum(getattr(get_tg_media_details(msg), "file_size", 0) or 0 for msg in messages) or 1
+
+    progress_task = asyncio.create_task(
+        batch_progress(state, total_size, len(messages), response), name="tg_batch_dl_prog"
+    )
+
+    try:
+        results = await asyncio.gather(
+            *(download_batch_item(msg, dir_name, semaphore, state) for msg in messages), return_exceptions=True
+        )
+    finally:
+        progress_task.cancel()
+
+    manifest = []
+    downloaded = []
+
+    for msg, result in zip(messages, results):
+        entry = {"chat_id": msg.chat.id, "message_id": msg.id, "link": msg.link}
+        if isinstance(result, DownloadedFile):
+            entry.update(path=str(result.path), file_name=result.name, size=os.path.getsize(result.path))
+            downloaded.append(result)
+        else:
+            entry["error"] = str(result)
+        manifest.append(entry)
+
+    manifest_path = dir_name / "manifest.json"
+    with open(manifest_path, "w") as file:
+        json.dump(manifest, file, indent=2)
+
+    await response.edit(
+        f"<b>Downloaded</b> {len(downloaded)}/{len(messages)} files to <code>{dir_name}</code>"
+        f"\n\nManifest: <code>{manifest_path}</code>"
+    )
+    return downloaded
+
+
+async def download_batch_item(message: Message, dir_name: Path, semaphore: asyncio.Semaphore, state: dict):
+    tg_media = get_tg_media_details(message)
+    file_name = tg_media.file_name or get_filename_from_mime(tg_media.mime_type)
+    # message id prefix keeps same named files from overwriting each other
+    file_name = f"{message.id}_{file_name}"
+
+    async def track(current: int, _):
+        state["downloaded"][message.id] = current
+
+    async with semaphore:
+        path = await media_cache.download_tg(message, dir_name, file_name=file_name, progress=track)
+
+    state["done"] += 1
+    return DownloadedFile(file=path)
+
+
+def widen_transmissions(client: BOT, count: int):
+    """
+    Pyrogram lets max_concurrent_transmissions (1 by default) files download at once,
+    raise it so the batch actually runs in parallel across media sessions.
+    Only safe at startup, before anything is waiting on the old semaphore.
+    """
+    if getattr(client, "max_concurrent_transmissions", count) < count:
+        client.max_concurrent_transmissions = count
+        client.get_file_semaphore = asyncio.Semaphore(count)
+
+
+async def batch_progress(state: dict, total_size: int, total_files: int, response: Message):
+    while True:
+        await progress(
+            current_size=sum(state["downloaded"].values()),
+            total_size=total_size,
+            response=response,
+            action_str=f"Downloading... [{state['done']}/{total_files} files]",
+        )
+        await asyncio.sleep(5)
@@ -0,0 +1,4 @@
+from .drive import DB, MIB, UPLOADS_DB, Drive, drive
+from .index import INDEX_DB, DriveIndex, drive_index
+from .manager import Transfer, TransferManager, transfer_manager
+from .sync import SYNC_DB, get_folder_id, sync_to_drive
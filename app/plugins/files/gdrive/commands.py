@@ -0,0 +1,558 @@
+import asyncio
+import glob
+import json
+import os
+import shutil
+from functools import partial
+
+from google.oauth2.credentials import Credentials
+from google_auth_oauthlib.flow import InstalledAppFlow
+from pyrogram.enums import ParseMode
+from ub_core import BOT, Config, Message
+from ub_core.utils import DownloadedFile, get_tg_media_details
+
+from app.plugins.files.gdrive import (
+    DB,
+    MIB,
+    UPLOADS_DB,
+    Transfer,
+    drive,
+    drive_index,
+    get_folder_id,
+    sync_to_drive,
+    transfer_manager,
+)
+from app.plugins.files.upload import upload_to_tg
+
+
+@BOT.add_cmd("gsetup")
+async def gdrive_creds_setup(bot: BOT, message: Message):
+    """
+    CMD: GSETUP
+    INFO: Generated and save O-Auth Creds Json to bot.
+    USAGE: .gsetup {reply to credentials.json file}
+    """
+
+    try:
+        assert message.replied.document.file_name == "credentials.json"
+    except (AssertionError, AttributeError):
+        await message.reply("credentials.json not found.")
+        return
+
+    try:
+        cred_file = await message.replied.download(in_memory=True)
+        cred_file.seek(0)
+        flow = InstalledAppFlow.from_client_config(
+            json.load(cred_file),
+            ["https://www.googleapis.com/auth/drive"],
+        )
+        flow.redirect_uri = "urn:ietf:wg:oauth:2.0:oob"
+        auth_url, state = flow.authorization_url(prompt="consent")
+
+        auth_message = await message.reply(
+            f"Please go to this URL and authorize:\n{auth_url}\n\nReply to this message with the code within 30 seconds.",
+        )
+        code_message = await auth_message.get_response(
+            from_user=message.from_user.id,
+            reply_to_message_id=auth_message.id,
+            timeout=30,
+        )
+
+        await auth_message.delete()
+
+        if not code_message:
+            await message.reply("expired")
+            return
+
+        await code_message.delete()
+        flow.fetch_token(code=code_message.text)
+        await DB.add_data({"_id": "drive_creds", "creds": json.loads(flow.credentials.to_json())})
+        await drive.set_creds()
+        await message.reply("Creds Saved!")
+    except Exception as e:
+        await message.reply(e)
+
+
+@BOT.add_cmd("agcreds")
+async def set_drive_creds(bot: BOT, message: Message):
+    """
+    CMD: AGCREDS
+    INFO: Add your pre generated O-Auth Creds Json to bot.
+    USAGE: .agcreds {data}
+    """
+    creds = message.input.strip()
+
+    if not creds:
+        await message.reply("Enter Creds!!!")
+        return
+
+    try:
+        creds_json = json.loads(creds)
+        creds = Credentials.from_authorized_user_info(info=creds_json)
+        # set_creds refreshes the token if it is already expired
+        await DB.add_data({"_id": "drive_creds", "creds": json.loads(creds.to_json())})
+        await drive.set_creds()
+        await message.reply("Creds added!")
+    except Exception as e:
+        await message.reply(e)
+
+
+@BOT.add_cmd("rgcreds")
+async def remove_drive_creds(bot: BOT, message: Message):
+    response = await message.reply("Are you sure you want to delete drive creds?\nreply with y to continue")
+
+    resp = await response.get_response(from_user=message.from_user.id)
+    if not (resp and resp.text in ("y", "Y")):
+        await response.edit("Aborted!!!")
+        return
+
+    drive.is_authenticated = False
+    await DB.delete_data({"_id": "drive_creds"})
+    await drive_index.reset()
+    await response.edit("Creds Deleted Successfully!")
+
+
+@BOT.add_cmd(cmd="gresume")
+@drive.ensure_creds
+async def resume_drive_upload(bot: BOT, message: Message):
+    """
+    CMD: GRESUME
+    INFO: Continue Drive uploads interrupted by errors or restarts.
+    FLAGS:
+        -c: clear a saved upload
+    USAGE:
+        .gresume (lists interrupted uploads)
+        .gresume <id>
+        .gresume -c <id>
+    """
+    upload_id = message.filtered_input.strip()
+
+    if not upload_id:
+        uploads = [upload async for upload in UPLOADS_DB.find()]
+
+        if not uploads:
+            await message.reply("No interrupted uploads.")
+            return
+
+        output_list = [f"<b>{len(uploads)}</b> interrupted uploads:\n"]
+
+        for upload in uploads:
+            output_list.append(
+                f"• <code>{upload['_id']}</code> {upload['name']}"
+                f"\n  {upload['offset'] / MIB:.1f} / {upload['size'] / MIB:.1f} MiB"
+            )
+
+        await message.reply("\n".join(output_list))
+        return
+
+    upload = await UPLOADS_DB.find_one({"_id": upload_id})
+
+    if not upload:
+        await message.reply(f"No saved upload with id <code>{upload_id}</code>.")
+        return
+
+    if upload_id in drive.active_uploads:
+        await message.reply(f"<code>{upload_id}</code> is already being uploaded.")
+        return
+
+    if "-c" in message.flags:
+        await UPLOADS_DB.delete_data(id=upload_id)
+        await message.reply(f"<code>{upload_id}</code> cleared.")
+        return
+
+    response = await message.reply(f"Resuming <code>{upload['name']}</code>...")
+    await response.edit(await drive.resume_upload(upload, response))
+
+
+@BOT.add_cmd("gls")
+@drive.ensure_creds
+async def list_drive(bot: BOT, message: Message):
+    """
+    CMD: GLS
+    INFO: List Files/Folders from Drive
+    FLAGS:
+        -f: list files only
+        -d: list dirs only
+        -id: list via folder id
+        -l: limit of results (10 by default)
+        -live: query drive directly instead of the local index
+
+    USAGE:
+        .gls [-f|-d]
+        .gls [-f|-d] abc (lists files/folders matching abc in name)
+        .gls -id <folder id>
+        .gls [-f|-d] -l 20 (lists 20 results)
+        .gls -l 20 abc (tries to list 20 results containing abc in name)
+    """
+    response = await message.reply("Listing...")
+    flags = message.flags
+    filtered_input_chunks = message.filtered_input.split(maxsplit=1)
+
+    kwargs = {
+        "_id": False,
+        "limit": 10,
+        "folder_only": False,
+        "file_only": False,
+        "search_param": None,
+    }
+
+    # Search by ID
+    if "-id" in flags:
+        kwargs["_id"] = True
+    # list folders
+    if "-d" in flags:
+        kwargs["folder_only"] = True
+    # list files
+    if "-f" in flags:
+        kwargs["file_only"] = True
+
+    # limit total number of results
+    if "-l" in flags:
+        kwargs["limit"] = int(filtered_input_chunks[0])
+        # search for specific files/dirs
+        if len(filtered_input_chunks) == 2:
+            kwargs["search_param"] = filtered_input_chunks[1]
+    else:
+        # search for specific files/dirs
+        kwargs["search_param"] = message.filtered_input.strip() or None
+
+    remote_files = None
+
+    if drive_index.ready and "-live" not in flags:
+        remote_files = drive_index.list_contents(**kwargs)
+
+    if remote_files is None:
+        remote_files = await drive.list_contents(**kwargs)
+
+    if not remote_files:
+        await response.edit("No results found.")
+        return
+
+    folders = []
+    files = [""]
+    shortcuts = [""]
+
+    for file in remote_files:
+        url = drive.URL_TEMPLATE.format(media_id=file["id"])
+        mime = file["mimeType"]
+        if mime == drive.FOLDER_MIME:
+            folders.append(f"📁 <a href={url}>{file['name']}</a>")
+        elif mime == drive.SHORTCUT_MIME:
+            shortcut_details = file.get("shortcutDetails", {})
+            target_id = shortcut_details.get("targetId")
+            if target_id:
+                url = drive.URL_TEMPLATE.format(media_id=target_id)
+            target = drive_index.resolve(file)
+            target_name = f" → {target['name']}" if target is not file else ""
+            shortcuts.append(f"🔗 <a href={url}>{file['name']}</a>{target_name}")
+        else:
+            files.append(f"📄 <a href={url}>{file['name']}</a>")
+
+    list_str = "Results:\n\n" + "\n".join(folders + shortcuts + files)
+
+    await response.edit(list_str, parse_mode=ParseMode.HTML)
+
+
+@BOT.add_cmd(cmd="gup")
+@drive.ensure_creds
+async def upload_to_drive(bot: BOT, message: Message):
+    """
+    CMD: GUP
+    INFO: Upload file to drive, drive file/folder links are copied server-side.
+    FLAGS:
+        -id: folder id
+        -e: if the url is encoded
+        -hp: high priority, skips ahead of other queued uploads
+    USAGE:
+        .gup [reply to a message | url]
+        .gup -id <folder id> [reply to a message | url]
+    """
+    reply = message.replied
+    response = await message.reply("Checking Input...")
+
+    if reply and reply.media:
+        folder_id = message.filtered_input if "-id" in message.flags else None
+        media = get_tg_media_details(reply)
+        name, size = media.file_name, getattr(media, "file_size", 0)
+        upload_func = partial(drive.upload_from_telegram, reply, response, folder_id=folder_id)
+
+    elif message.filtered_input.startswith("http"):
+        if "-id" in message.flags:
+            folder_id, file_url = message.filtered_input.split(maxsplit=1)
+        else:
+            folder_id = None
+            file_url = message.filtered_input
+
+        name = file_url
+        size = 0
+        upload_func = partial(
+            drive.upload_from_url,
+            file_url=file_url,
+            is_encoded="-e" in message.flags,
+            folder_id=folder_id,
+            message_to_edit=response,
+        )
+
+    else:
+        await response.edit("Invalid Input!!!")
+        return
+
+    transfer = transfer_manager.submit(name=name, func=upload_func, size=size, priority=get_priority(message))
+
+    if len(transfer_manager.transfers) > transfer_manager.WORKERS:
+        await response.edit(f"Queued for upload [<code>{transfer.key}</code>]...")
+
+    await response.edit(await transfer.result)
+
+
+@BOT.add_cmd(cmd="gupb")
+@drive.ensure_creds
+async def bulk_upload_to_drive(bot: BOT, message: Message):
+    """
+    CMD: GUPB
+    INFO: Upload a local folder or a replied album to drive with a single progress message.
+    FLAGS:
+        -id: folder id
+        -hp: high priority, skips ahead of other queued uploads
+    USAGE:
+        .gupb downloads/videos
+        .gupb -id <folder id> downloads/videos
+        .gupb [-id <folder id>] [reply to an album]
+    """
+    response = await message.reply("Checking Input...")
+    reply = message.replied
+
+    if "-id" in message.flags:
+        folder_id, _, path = message.filtered_input.partition(" ")
+    else:
+        folder_id, path = None, message.filtered_input
+
+    priority = get_priority(message)
+    transfers: list[Transfer] = []
+
+    if reply and reply.media_group_id:
+        for media_message in await reply.get_media_group():
+            media = get_tg_media_details(media_message)
+            transfers.append(
+                transfer_manager.submit(
+                    name=media.file_name,
+                    func=partial(drive.upload_from_telegram, media_message, folder_id=folder_id),
+                    size=getattr(media, "file_size", 0),
+                    priority=priority,
+                )
+            )
+
+    elif path and os.path.isdir(path.strip()):
+        path = path.strip()
+        files = sorted(glob.glob(os.path.join(path, "**"), recursive=True))
+        # relative path -> created drive folder, so sub folders are recreated once each
+        folders: dict[str, dict] = {}
+
+        for file in filter(os.path.isfile, files):
+            rel_dir = os.path.dirname(os.path.relpath(file, path))
+            file_folder_id = await get_folder_id(rel_dir, folder_id or drive.DRIVE_ROOT_ID, folders)
+            transfers.append(
+                transfer_manager.submit(
+                    name=os.path.relpath(file, path),
+                    func=partial(drive.upload_from_path, file, folder_id=file_folder_id),
+                    size=os.path.getsize(file),
+                    priority=priority,
+                )
+            )
+
+    if not transfers:
+        await response.edit("Reply to an album or give a folder path.")
+        return
+
+    await response.edit(f"Queued <b>{len(transfers)}</b> files for upload...")
+
+    progress_task = asyncio.create_task(transfer_manager.bulk_progress(transfers, response), name="drive_bulk_prog")
+    try:
+        results = await asyncio.gather(*(transfer.result for transfer in transfers))
+    finally:
+        progress_task.cancel()
+
+    output_list = [f"Uploaded <b>{len(transfers)}</b> files:\n"]
+
+    for transfer, result in zip(transfers, results):
+        if result and result.startswith("http"):
+            output_list.append(f"• <a href={result}>{transfer.name}</a>")
+        else:
+            output_list.append(f"• {transfer.name}: {result}")
+
+    await response.edit("\n".join(output_list), disable_preview=True)
+
+
+@BOT.add_cmd(cmd="gtq")
+async def drive_transfer_queue(bot: BOT, message: Message):
+    """
+    CMD: GTQ
+    INFO: View queued and running Drive uploads.
+    """
+    transfers = list(transfer_manager.transfers.values())
+
+    if not transfers:
+        await message.reply("No Drive uploads in queue.", del_in=8)
+        return
+
+    output_list = [f"<b>{len(transfers)}</b> Drive uploads:\n"]
+
+    for transfer in transfers:
+        size = f"{transfer.uploaded_size / MIB:.1f} / {transfer.size / MIB:.1f} MiB" if transfer.size else ""
+        output_list.append(f"• <code>{transfer.key}</code> {transfer.name}\n  {transfer.status} {size}")
+
+    await message.reply("\n".join(output_list), del_in=30)
+
+
+@BOT.add_cmd(cmd="gdl")
+@drive.ensure_creds
+async def download_from_drive(bot: BOT, message: Message):
+    """
+    CMD: GDL
+    INFO: Download a file or a whole folder from drive.
+    FLAGS:
+        -tg: upload the downloaded files to telegram and delete them locally
+    USAGE:
+        .gdl <file/folder id | link>
+        .gdl -tg <file/folder id | link>
+    """
+    if not message.filtered_input:
+        await message.reply("Give a drive file/folder id or link.")
+        return
+
+    response = await message.reply("Fetching metadata...")
+
+    try:
+        metadata = await drive.get_metadata(drive.extract_id(message.filtered_input))
+
+        if metadata["mimeType"] == drive.SHORTCUT_MIME:
+            target_id = metadata["shortcutDetails"]["targetId"]
+            metadata = drive_index.files.get(target_id) or await drive.get_metadata(target_id)
+    except Exception as e:
+        await response.edit(str(e))
+        return
+
+    download_dir = Config.TEMP_DOWNLOAD_PATH()
+
+    if metadata["mimeType"] == drive.FOLDER_MIME:
+        files = [
+            dict(file, path=os.path.join(metadata["name"], file["path"]))
+            for file in await drive.walk_folder(metadata["id"])
+        ]
+    else:
+        files = [dict(metadata, path=metadata["name"])]
+
+    # docs/sheets etc. have no size and can't be fetched with alt=media
+    files = [file for file in files if "size" in file and file["mimeType"] != drive.FOLDER_MIME]
+
+    if not files:
+        await response.edit("Nothing to download, Google Docs/Sheets can't be downloaded as is.")
+        return
+
+    store = {"size": sum(int(file["size"]) for file in files), "downloaded": 0, "done": False}
+    progress_task = asyncio.create_task(
+        drive.progress_worker(
+            store, response, action_str=f"Downloading {len(files)} files from Drive...", size_key="downloaded"
+        ),
+        name="drive_dl_prog",
+    )
+
+    to_tg = "-tg" in message.flags
+    done = 0
+
+    try:
+        for file in files:
+            path = os.path.join(download_dir, file["path"])
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            await drive.download_file(file["id"], path, int(file["size"]), store)
+
+            if not to_tg:
+                done += 1
+                continue
+
+            # one file at a time, so at most one of them is ever on disk
+            try:
+                temp_resp = await response.reply(f"Uploading <code>{os.path.basename(path)}</code>...")
+                await upload_to_tg(file=DownloadedFile(file=path), message=message, response=temp_resp)
+                done += 1
+            finally:
+                os.remove(path)
+
+    except Exception as e:
+        await response.edit(f"Error:\n{e}")
+        return
+
+    finally:
+        store["done"] = True
+        progress_task.cancel()
+        if to_tg:
+            shutil.rmtree(download_dir, ignore_errors=True)
+
+    if to_tg:
+        await response.edit(f"Uploaded <b>{done}</b> files from Drive.")
+    else:
+        await response.edit(f"Downloaded <b>{done}</b> files to <code>{download_dir}</code>")
+
+
+@BOT.add_cmd(cmd="gsync")
+@drive.ensure_creds
+async def sync_folder_to_drive(bot: BOT, message: Message):
+    """
+    CMD: GSYNC
+    INFO: Mirror a local folder to a drive folder, uploading only new or changed files.
+    FLAGS:
+        -r: rebuild the remote index instead of using the saved one
+        -d: trash remote files that were deleted locally
+        -hp: high priority, skips ahead of other queued uploads
+    USAGE:
+        .gsync downloads/videos <folder id>
+        .gsync -r -d downloads/videos <folder id>
+    """
+    try:
+        local_dir, folder_id = message.filtered_input.rsplit(maxsplit=1)
+    except ValueError:
+        await message.reply("Give a local folder path and a drive folder id.")
+        return
+
+    if not os.path.isdir(local_dir):
+        await message.reply(f"<code>{local_dir}</code> is not a folder.")
+        return
+
+    response = await message.reply("Comparing with Drive...")
+
+    transfers, unchanged, trashed = await sync_to_drive(
+        local_dir=local_dir,
+        folder_id=drive.extract_id(folder_id),
+        refresh="-r" in message.flags,
+        delete="-d" in message.flags,
+        priority=get_priority(message),
+    )
+
+    summary = f"Unchanged: <b>{unchanged}</b>\nTrashed: <b>{trashed}</b>"
+
+    if not transfers:
+        await response.edit(f"Drive is up to date.\n{summary}")
+        return
+
+    progress_task = asyncio.create_task(transfer_manager.bulk_progress(transfers, response), name="drive_sync_prog")
+    try:
+        results = await asyncio.gather(*(transfer.result for transfer in transfers))
+    finally:
+        progress_task.cancel()
+
+    failed = [
+        f"• {transfer.name}: {result}"
+        for transfer, result in zip(transfers, results)
+        if not (result and result.startswith("http"))
+    ]
+
+    await response.edit(
+        f"Synced <b>{len(transfers) - len(failed)}</b> files.\n{summary}\n" + "\n".join(failed),
+        disable_preview=True,
+    )
+
+
+def get_priority(message: Message) -> int:
+    if "-hp" in message.flags:
+        return transfer_manager.HIGH_PRIORITY
+    return transfer_manager.NORMAL_PRIORITY
@@ -0,0 +1,870 @@
+import asyncio
+import hashlib
+import json
+import os
+import re
+import time
+import uuid
+from collections import defaultdict
+from collections.abc import AsyncIterator
+from datetime import UTC, datetime, timedelta
+from functools import wraps
+
+import aiohttp
+from google.oauth2.credentials import Credentials
+from ub_core import BOT, Config, CustomDB, Message, bot
+from ub_core.utils import Download, get_tg_media_details, progress
+from yarl import URL
+
+from app.plugins.files.ranged import ranged_download
+from app.rate_limit import RateLimiter
+
+DB = CustomDB["COMMON_SETTINGS"]
+
+UPLOADS_DB = CustomDB["DRIVE_UPLOADS"]
+
+KIB = 1024
+MIB = KIB * KIB
+
+
+def get_chunk_size(size_kib: str | int) -> int:
+    """
+    Drive needs every chunk but the last to be a multiple of 256 KiB.
+    """
+    size = int(size_kib) * KIB // (256 * KIB) * (256 * KIB)
+    return min(max(size, 256 * KIB), 64 * MIB)
+
+
+INSTRUCTIONS = """
+Gdrive Credentials and Access token not found!
+
+- Get credentials.json from: https://console.cloud.google.com
+
+<blockquote>Steps:
+• Enable google drive api.
+• Setup consent screen.
+• Select external app.
+• Add yourself in audience.
+• Go back.
+• Add the Google drive scope in data access.
+• Create a desktop app and download the json in credentials section.</blockquote>
+
+- Upload this file to your saved messages and reply to it with .gsetup
+"""
+
+
+class Drive:
+    URL_TEMPLATE = "https://drive.google.com/file/d/{media_id}/view?usp=sharing"
+    FOLDER_URL_TEMPLATE = "https://drive.google.com/drive/folders/{media_id}"
+    DRIVE_LINK_REGEX = re.compile(r"https?://(?:drive|docs)\.google\.com/.*(?:/d/|/folders/|[?&]id=)[\w-]{10,}")
+    FOLDER_MIME = "application/vnd.google-apps.folder"
+    SHORTCUT_MIME = "application/vnd.google-apps.shortcut"
+    DRIVE_ROOT_ID = os.getenv("DRIVE_ROOT_ID", "root")
+    CHUNK_SIZE = get_chunk_size(os.getenv("DRIVE_CHUNK_SIZE", 512))
+    READ_SIZE = min(CHUNK_SIZE, MIB)
+    # chunks read ahead of the one being sent to drive
+    PIPELINE_DEPTH = 2
+    MAX_RETRIES = 5
+    # seconds between saving an upload's offset to DB
+    SAVE_INTERVAL = 30
+    # KiB/s shared by all uploads, 0 for no limit
+    BANDWIDTH_LIMIT = int(os.getenv("DRIVE_BANDWIDTH_LIMIT", 0)) * KIB
+    DOWNLOAD_URL = "https://www.googleapis.com/drive/v3/files/{file_id}?alt=media&supportsAllDrives=true"
+    DOWNLOAD_CONNECTIONS = int(os.getenv("DRIVE_DOWNLOAD_CONNECTIONS", 4))
+    # smaller files or parts aren't split further into ranged GETs
+    MIN_PART_SIZE = 8 * MIB
+    FILE_FIELDS = "id, name, mimeType, size, md5Checksum, shortcutDetails"
+    API_URL = "https://www.googleapis.com/drive/v3"
+    # refresh the access token this many seconds before it expires
+    REFRESH_MARGIN = 300
+    # parallel files.copy calls while cloning a folder
+    COPY_CONCURRENCY = 10
+
+    def __init__(self):
+        self._aiohttp_session = None
+        # bytes per second, chunks may overdraw it and then wait the debt out
+        self.bandwidth = RateLimiter(rate=self.BANDWIDTH_LIMIT, burst=self.BANDWIDTH_LIMIT, name="drive bandwidth")
+        self._progress_store: dict[str, dict[str, str | int | asyncio.Task]] = defaultdict(dict)
+        # IDs of saved uploads being sent right now, new or resumed
+        self.active_uploads: set[str] = set()
+        self._creds: Credentials | None = None
+        self._refresh_lock = asyncio.Lock()
+        self.is_authenticated = False
+
+    async def async_init(self):
+        if self._aiohttp_session is None:
+            self._aiohttp_session = aiohttp.ClientSession()
+            Config.TASK_MANAGER.add_exit(self._aiohttp_session.close)
+        await self.set_creds()
+
+    @property
+    def creds(self):
+        return self._creds
+
+    @creds.setter
+    def creds(self, creds):
+        self._creds = creds
+
+    async def set_creds(self):
+        cred_data = await DB.find_one({"_id": "drive_creds"})
+        if not cred_data:
+            self.is_authenticated = False
+            return
+
+        self.creds = Credentials.from_authorized_user_info(
+            info=cred_data["creds"], scopes=["https://www.googleapis.com/auth/drive"]
+        )
+        self.is_authenticated = True
+
+        if self.token_expiring():
+            await self.refresh_creds()
+
+    def token_expiring(self, margin: int = 0) -> bool:
+        if not isinstance(self._creds, Credentials) or not self._creds.refresh_token:
+            return False
+        if not self._creds.token or not self._creds.expiry:
+            return True
+        # google-auth keeps expiry as a naive UTC datetime
+        now = datetime.now(UTC).replace(tzinfo=None)
+        return (self._creds.expiry - now).total_seconds() <= margin
+
+    async def refresh_creds(self, margin: int = 0):
+        """
+        Fetches a new access token over the shared aiohttp session and saves it to DB.
+        """
+        async with self._refresh_lock:
+            # another caller may have refreshed while this one waited
+            if not self.token_expiring(margin):
+                return
+
+            data = {
+                "client_id": self._creds.client_id,
+                "client_secret": self._creds.client_secret,
+                "refresh_token": self._creds.refresh_token,
+                "grant_type": "refresh_token",
+            }
+            async with self._aiohttp_session.post(self._creds.token_uri, data=data) as resp:
+                result = await resp.json(content_type=None)
+                if resp.status != 200:
+                    raise Exception(f"Token refresh failed: {result}")
+
+            self._creds.token = result["access_token"]
+            self._creds.expiry = datetime.now(UTC).replace(tzinfo=None) + timedelta(seconds=result["expires_in"])
+            await DB.add_data({"_id": "drive_creds", "creds": json.loads(self._creds.to_json())})
+            bot.log.info("Gdrive Creds Auto-Refreshed")
+
+    async def get_token(self) -> str:
+        # normally a no-op, token_refresh_worker renews the token ahead of expiry
+        if self.token_expiring(margin=10):
+            await self.refresh_creds(margin=10)
+        return self._creds.token
+
+    async def api_request(self, method: str, path: str = "/files", params: dict = None, body: dict = None) -> dict:
+        """
+        Calls the drive v3 API on the shared aiohttp session,
+        retrying rate limit and 5xx responses with exponential backoff.
+        :param path: Appended to API_URL, like /files/{file_id}.
+        :return: Parsed JSON response.
+        """
+        params = {"supportsAllDrives": "true", **(params or {})}
+
+        for attempt in range(self.MAX_RETRIES + 1):
+            headers = {"Authorization": f"Bearer {await self.get_token()}"}
+
+            async with self._aiohttp_session.request(
+                method, self.API_URL + path, params=params, json=body, headers=headers
+            ) as resp:
+                if resp.status < 400:
+                    return await resp.json()
+                text = await resp.text()
+
+            rate_limited = resp.status == 429 or (resp.status == 403 and "ateLimitExceeded" in text)
+            if not (rate_limited or resp.status >= 500) or attempt == self.MAX_RETRIES:
+                raise Exception(f"Drive API request failed with {resp.status}: {text}")
+
+            await asyncio.sleep(2**attempt)
+
+    def ensure_creds(self, func):
+        @wraps(func)
+        async def inner(bot: BOT, message: Message):
+            if not self.is_authenticated:
+                await message.reply(INSTRUCTIONS)
+            else:
+                await func(bot, message)
+
+        return inner
+
+    async def list_contents(
+        self,
+        _id: bool = False,
+        limit: int = 10,
+        file_only: bool = False,
+        folder_only: bool = False,
+        search_param: str | None = None,
+    ) -> list[dict[str, str | int]]:
+        """
+        :param _id: The ID of the folder to list files from.
+        :param limit: Number of results to fetch.
+        :param file_only: If True, only list files.
+        :param folder_only: If True, only list folders.
+        :param search_param: A string to search for in file/folder names.
+        :return: A list of dictionaries containing file/folder id, name and mimeType.
+        """
+        query_params = ["trashed=false"]
+
+        if folder_only:
+            query_params.append(f"mimeType = '{self.FOLDER_MIME}'")
+        elif file_only:
+            query_params.append(f"mimeType != '{self.FOLDER_MIME}'")
+
+        if search_param is not None:
+            if _id:
+                query_params.append(f"'{search_param}' in parents")
+            else:
+                query_params.append(f"name contains '{search_param}'")
+        else:
+            query_params.append(f"'{self.DRIVE_ROOT_ID}' in parents")
+
+        params = {
+            "q": " and ".join(query_params),
+            "fields": "nextPageToken, files(id, name, mimeType, shortcutDetails)",
+            "includeItemsFromAllDrives": "true",
+        }
+        files = []
+
+        while len(files) < limit:
+            result = await self.api_request("GET", params={**params, "pageSize": limit - len(files)})
+            files.extend(result.get("files", []))
+
+            if not (page_token := result.get("nextPageToken")):
+                break
+            params["pageToken"] = page_token
+
+        return files[0:limit]
+
+    async def upload_from_url(
+        self,
+        file_url: str,
+        is_encoded: bool = False,
+        folder_id: str = None,
+        message_to_edit: Message = None,
+        progress_key: str = None,
+    ):
+        if self.DRIVE_LINK_REGEX.match(file_url):
+            try:
+                return await self.clone(self.extract_id(file_url), folder_id, message_to_edit)
+            except Exception as e:
+                return self.format_error(e, None)
+
+        progress_key = progress_key or file_url
+        try:
+            file_id = await self._upload_from_url(file_url, is_encoded, folder_id, message_to_edit, progress_key)
+            if file_id is not None:
+                return self.URL_TEMPLATE.format(media_id=file_id)
+        except Exception as e:
+            return self.format_error(e, self._progress_store.get(progress_key, {}).get("upload_id"))
+        finally:
+            self.clear_progress(progress_key)
+
+    async def upload_from_telegram(
+        self,
+        media_message: Message,
+        message_to_edit: Message = None,
+        folder_id: str = None,
+        progress_key: str = None,
+    ):
+        progress_key = progress_key or message_to_edit.task_id
+        try:
+            file_id = await self._upload_from_telegram(media_message, message_to_edit, folder_id, progress_key)
+            if file_id is not None:
+                return self.URL_TEMPLATE.format(media_id=file_id)
+        except Exception as e:
+            return self.format_error(e, self._progress_store.get(progress_key, {}).get("upload_id"))
+        finally:
+            self.clear_progress(progress_key)
+
+    async def upload_from_path(
+        self,
+        path: str,
+        folder_id: str = None,
+        message_to_edit: Message = None,
+        progress_key: str = None,
+        file_id: str = None,
+    ):
+        progress_key = progress_key or path
+        try:
+            file_id = await self._upload_from_path(path, folder_id, message_to_edit, progress_key, file_id)
+            if file_id is not None:
+                return self.URL_TEMPLATE.format(media_id=file_id)
+        except Exception as e:
+            return self.format_error(e, self._progress_store.get(progress_key, {}).get("upload_id"))
+        finally:
+            self.clear_progress(progress_key)
+
+    async def resume_upload(self, upload: dict, message_to_edit: Message = None):
+        if upload["_id"] in self.active_uploads:
+            return f"<code>{upload['_id']}</code> is already being uploaded."
+
+        self.active_uploads.add(upload["_id"])
+        try:
+            file_id = await self._resume_upload(upload, message_to_edit)
+            if file_id is not None:
+                return self.URL_TEMPLATE.format(media_id=file_id)
+        except Exception as e:
+            return self.format_error(e, upload["_id"])
+        finally:
+            self.clear_progress(upload["_id"])
+            self.active_uploads.discard(upload["_id"])
+
+    def clear_progress(self, progress_key: str):
+        store = self._progress_store.pop(progress_key, {})
+        store["done"] = True
+        self.active_uploads.discard(store.get("upload_id"))
+        task = store.get("edit_task")
+        if isinstance(task, asyncio.Task):
+            task.cancel()
+
+    @staticmethod
+    def format_error(error: Exception, upload_id: str | None) -> str:
+        if upload_id:
+            return f"Error:\n{error}\n\nResume with: <code>.gresume {upload_id}</code>"
+        return f"Error:\n{error}"
+
+    @staticmethod
+    def extract_id(link_or_id: str) -> str:
+        """
+        :return: File/Folder ID from a drive link or the input as is.
+        """
+        match = re.search(r"(?:/d/|/folders/|[?&]id=)([\w-]{10,})", link_or_id)
+        return match.group(1) if match else link_or_id.strip()
+
+    async def get_metadata(self, file_id: str) -> dict:
+        return await self.api_request("GET", f"/files/{file_id}", params={"fields": self.FILE_FIELDS})
+
+    async def clone(self, source_id: str, folder_id: str = None, message_to_edit: Message = None) -> str:
+        """
+        Server-side copy of a drive file or folder, nothing passes through the bot.
+        :return: Link to the copy.
+        """
+        metadata = await self.get_metadata(source_id)
+
+        if metadata["mimeType"] == self.SHORTCUT_MIME:
+            metadata = await self.get_metadata(metadata["shortcutDetails"]["targetId"])
+
+        if metadata["mimeType"] != self.FOLDER_MIME:
+            file = await self.copy_file(metadata, folder_id or self.DRIVE_ROOT_ID)
+            return self.URL_TEMPLATE.format(media_id=file["id"])
+
+        if isinstance(message_to_edit, Message):
+            await message_to_edit.edit(f"Cloning folder <code>{metadata['name']}</code>...")
+
+        new_folder_id = await self.create_folder(metadata["name"], folder_id)
+        await self.clone_folder(metadata["id"], new_folder_id, asyncio.Semaphore(self.COPY_CONCURRENCY))
+        return self.FOLDER_URL_TEMPLATE.format(media_id=new_folder_id)
+
+    async def clone_folder(self, source_id: str, folder_id: str, semaphore: asyncio.Semaphore):
+        tasks = []
+
+        for file in await self._list_children(source_id):
+            if file["mimeType"] == self.FOLDER_MIME:
+                new_folder_id = await self.create_folder(file["name"], folder_id)
+                tasks.append(self.clone_folder(file["id"], new_folder_id, semaphore))
+            else:
+                tasks.append(self.copy_file(file, folder_id, semaphore))
+
+        await asyncio.gather(*tasks)
+
+    async def copy_file(self, file: dict, folder_id: str, semaphore: asyncio.Semaphore = None) -> dict:
+        async with semaphore or asyncio.Semaphore(1):
+            # shortcuts can't be copied, point a new one at the same target
+            if file["mimeType"] == self.SHORTCUT_MIME:
+                body = {
+                    "name": file["name"],
+                    "mimeType": self.SHORTCUT_MIME,
+                    "parents": [folder_id],
+                    "shortcutDetails": {"targetId": file["shortcutDetails"]["targetId"]},
+                }
+                return await self.api_request("POST", params={"fields": "id"}, body=body)
+
+            body = {"name": file["name"], "parents": [folder_id]}
+            return await self.api_request("POST", f"/files/{file['id']}/copy", params={"fields": "id"}, body=body)
+
+    async def walk_folder(self, folder_id: str, path: str = "") -> list[dict]:
+        """
+        :return: Metadata of every file and folder under folder_id, each with its relative path.
+        """
+        contents = []
+
+        for file in await self._list_children(folder_id):
+            file["path"] = os.path.join(path, file["name"])
+            contents.append(file)
+
+            if file["mimeType"] == self.FOLDER_MIME:
+                contents.extend(await self.walk_folder(file["id"], file["path"]))
+
+        return contents
+
+    async def _list_children(self, folder_id: str) -> list[dict]:
+        params = {
+            "q": f"'{folder_id}' in parents and trashed=false",
+            "fields": f"nextPageToken, files({self.FILE_FIELDS})",
+            "pageSize": 1000,
+            "includeItemsFromAllDrives": "true",
+        }
+        files = []
+
+        while True:
+            result = await self.api_request("GET", params=params)
+            files.extend(result.get("files", []))
+
+            if not (page_token := result.get("nextPageToken")):
+                return files
+            params["pageToken"] = page_token
+
+    async def create_folder(self, name: str, parent_id: str = None) -> str:
+        body = {"name": name, "mimeType": self.FOLDER_MIME, "parents": [parent_id or self.DRIVE_ROOT_ID]}
+        folder = await self.api_request("POST", params={"fields": "id"}, body=body)
+        return folder["id"]
+
+    async def trash(self, file_id: str):
+        await self.api_request("PATCH", f"/files/{file_id}", body={"trashed": True})
+
+    async def download_file(self, file_id: str, path: str, size: int, store: dict):
+        """
+        Downloads the file with up to DOWNLOAD_CONNECTIONS ranged GETs,
+        each writing its part straight into a preallocated file.
+        """
+        part_size = max(-(-size // max(self.DOWNLOAD_CONNECTIONS, 1)), self.MIN_PART_SIZE)
+
+        async def auth_headers() -> dict:
+            return {"Authorization": f"Bearer {await self.get_token()}"}
+
+        await ranged_download(
+            url=self.DOWNLOAD_URL.format(file_id=file_id),
+            path=path,
+            size=size,
+            part_size=part_size,
+            state=store,
+            headers=auth_headers,
+        )
+
+    @staticmethod
+    def md5sum(path: str) -> str:
+        md5 = hashlib.md5()
+        with open(path, "rb") as file:
+            while data := file.read(MIB):
+                md5.update(data)
+        return md5.hexdigest()
+
+    async def create_file(self, file_name: str, folder_id: str = None, file_id: str = None) -> str:
+        """
+        :param file_id: ID of an existing file to replace the content of.
+        :return: An url pointing to a location in drive.
+        """
+        headers = {
+            "Authorization": f"Bearer {await self.get_token()}",
+            "Content-Type": "application/json",
+            "X-Upload-Content-Type": "application/octet-stream",
+        }
+        if file_id:
+            method = self._aiohttp_session.patch
+            url = f"https://www.googleapis.com/upload/drive/v3/files/{file_id}?uploadType=resumable"
+            body = {"name": file_name}
+        else:
+            method = self._aiohttp_session.post
+            url = "https://www.googleapis.com/upload/drive/v3/files?uploadType=resumable"
+            body = {"name": file_name, "parents": [folder_id or self.DRIVE_ROOT_ID]}
+
+        async with method(url=url, json=body, headers=headers) as resp:
+            if resp.status != 200:
+                text = await resp.text()
+                raise Exception(f"Initiate failed: {text}")
+            return resp.headers["Location"]
+
+    async def save_upload(self, location: str, file_name: str, size: int, source: dict) -> str:
+        """
+        Saves the resumable session so the upload can be continued with .gresume.
+        :param source: {"type": "url", "url": ..., "is_encoded": ...} | {"type": "tg", "file_id": ...}
+        :return: ID of the saved upload.
+        """
+        upload_id = uuid.uuid4().hex[:8]
+        self.active_uploads.add(upload_id)
+        await UPLOADS_DB.add_data(
+            {
+                "_id": upload_id,
+                "location": location,
+                "name": file_name,
+                "size": size,
+                "offset": 0,
+                "source": source,
+                "created": time.time(),
+            }
+        )
+        return upload_id
+
+    async def get_upload_status(self, location: str, total_size: int) -> tuple[int, str | None]:
+        """
+        :return: Number of bytes drive has committed and the file ID if the upload is complete.
+        """
+        headers = {"Content-Range": f"bytes */{total_size or '*'}", "Authorization": f"Bearer {await self.get_token()}"}
+        async with self._aiohttp_session.put(location, headers=headers) as resp:
+            if resp.status == 308:
+                return self.parse_range(resp.headers.get("Range")), None
+            elif resp.status in (200, 201):
+                file = await resp.json()
+                return total_size, file["id"]
+            elif resp.status == 404:
+                raise Exception("Upload session expired.")
+            else:
+                text = await resp.text()
+                raise Exception(f"Upload status check failed with {resp.status}: {text}")
+
+    async def finish_upload(self, location: str, size: int) -> str:
+        """
+        Tells drive the upload is size bytes in total, which completes a session no chunk completed.
+        :return: ID of the uploaded file.
+        """
+        headers = {"Content-Range": f"bytes */{size}", "Authorization": f"Bearer {await self.get_token()}"}
+        async with self._aiohttp_session.put(location, headers=headers) as resp:
+            if resp.status in (200, 201):
+                file = await resp.json()
+                return file["id"]
+            text = await resp.text()
+            raise Exception(f"Finishing upload failed with {resp.status}: {text}")
+
+    @staticmethod
+    def parse_range(range_header: str | None) -> int:
+        # bytes=0-1048575 -> 1048576 bytes committed
+        if not range_header:
+            return 0
+        return int(range_header.rsplit("-", maxsplit=1)[-1]) + 1
+
+    async def upload_chunk(self, location: str, start: int, chunk: memoryview | bytes, total_size: int) -> str | None:
+        """
+        Sends the chunk and retries with exponential backoff on 5xx and network errors,
+        re-sending only the part drive hasn't committed.
+        """
+        end = start + len(chunk)
+        attempt = 0
+
+        while True:
+            headers = {
+                "Content-Range": f"bytes {start}-{end - 1}/{total_size}",
+                "Authorization": f"Bearer {await self.get_token()}",
+            }
+            try:
+                async with self._aiohttp_session.put(location, headers=headers, data=chunk) as put:
+                    if put.status == 308:
+                        # Chunk accepted, not finished yet
+                        committed = self.parse_range(put.headers.get("Range"))
+                        if committed >= end:
+                            return None
+                        # Drive kept only a part of the chunk, send the rest.
+                        chunk = chunk[committed - start :]
+                        start = committed
+                        continue
+                    elif put.status in (200, 201):
+                        # File finished
+                        file = await put.json()
+                        return file["id"]
+                    elif put.status < 500 and put.status != 429:
+                        text = await put.text()
+                        raise Exception(f"Chunk upload failed with {put.status}: {text}")
+                    else:
+                        error = f"{put.status}: {await put.text()}"
+
+            except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                error = str(e) or type(e).__name__
+
+            if attempt == self.MAX_RETRIES:
+                raise Exception(f"Chunk upload failed after {attempt} retries: {error}")
+
+            await asyncio.sleep(2**attempt)
+            attempt += 1
+
+            committed, file_id = await self.get_upload_status(location, total_size)
+            if file_id:
+                return file_id
+            if committed >= end:
+                return None
+            if committed < start:
+                raise Exception(f"Drive lost data before byte {start}, upload can't continue.")
+
+            chunk = chunk[committed - start :]
+            start = committed
+
+    async def _upload_from_url(
+        self,
+        file_url: str,
+        is_encoded: bool = False,
+        folder_id: str = None,
+        message_to_edit: Message = None,
+        progress_key: str = None,
+    ):
+        async with Download(url=file_url, dir="", is_encoded_url=is_encoded) as downloader:
+            store = self._progress_store[progress_key or file_url]
+            store["size"] = downloader.size_bytes
+            store["done"] = False
+            store["uploaded_size"] = 0
+            store["read_size"] = 0
+            store["edit_task"] = asyncio.create_task(
+                self.progress_worker(store, message_to_edit), name="url_drive_up_prog"
+            )
+
+            file_session = downloader.file_response_session
+            file_session.raise_for_status()
+            drive_location = await self.create_file(downloader.file_name, folder_id)
+            store["upload_id"] = await self.save_upload(
+                location=drive_location,
+                file_name=downloader.file_name,
+                size=downloader.size_bytes,
+                source={"type": "url", "url": file_url, "is_encoded": is_encoded},
+            )
+
+            file_id = await self.pipe_upload(
+                source=downloader.iter_chunks(self.READ_SIZE),
+                location=drive_location,
+                total_size=downloader.size_bytes,
+                store=store,
+            )
+
+        store["done"] = True
+        return file_id
+
+    async def _upload_from_telegram(
+        self,
+        media_message: Message,
+        message_to_edit: Message = None,
+        folder_id: str = None,
+        progress_key: str = None,
+    ):
+        media = get_tg_media_details(media_message)
+
+        store = self._progress_store[progress_key or message_to_edit.task_id]
+        store["size"] = getattr(media, "file_size", 0)
+        store["done"] = False
+        store["uploaded_size"] = 0
+        store["read_size"] = 0
+        store["edit_task"] = asyncio.create_task(self.progress_worker(store, message_to_edit), name="tg_drive_up_prog")
+
+        drive_location = await self.create_file(media.file_name, folder_id)
+        store["upload_id"] = await self.save_upload(
+            location=drive_location,
+            file_name=media.file_name,
+            size=getattr(media, "file_size", 0),
+            source={"type": "tg", "file_id": media.file_id},
+        )
+
+        return await self.pipe_upload(
+            # noinspection PyTypeChecker
+            source=media_message._client.stream_media(message=media_message),
+            location=drive_location,
+            total_size=getattr(media, "file_size", 0),
+            store=store,
+        )
+
+    async def _upload_from_path(
+        self,
+        path: str,
+        folder_id: str = None,
+        message_to_edit: Message = None,
+        progress_key: str = None,
+        file_id: str = None,
+    ):
+        size = os.path.getsize(path)
+        file_name = os.path.basename(path)
+
+        store = self._progress_store[progress_key or path]
+        store["size"] = size
+        store["done"] = False
+        store["uploaded_size"] = 0
+        store["read_size"] = 0
+        store["edit_task"] = asyncio.create_task(
+            self.progress_worker(store, message_to_edit), name="path_drive_up_prog"
+        )
+
+        drive_location = await self.create_file(file_name, folder_id, file_id)
+        store["upload_id"] = await self.save_upload(
+            location=drive_location,
+            file_name=file_name,
+            size=size,
+            source={"type": "path", "path": os.path.abspath(path)},
+        )
+
+        return await self.pipe_upload(
+            source=self.iter_path(path), location=drive_location, total_size=size, store=store
+        )
+
+    async def _resume_upload(self, upload: dict, message_to_edit: Message = None):
+        committed, file_id = await self.get_upload_status(upload["location"], upload["size"])
+
+        if file_id:
+            await UPLOADS_DB.delete_data(id=upload["_id"])
+            return file_id
+
+        store = self._progress_store[upload["_id"]]
+        store["size"] = upload["size"]
+        store["done"] = False
+        store["uploaded_size"] = committed
+        store["read_size"] = committed
+        store["upload_id"] = upload["_id"]
+        store["edit_task"] = asyncio.create_task(self.progress_worker(store, message_to_edit), name="drive_resume_prog")
+
+        source = upload["source"]
+
+        if source["type"] == "url":
+            source_iter = self.iter_url(URL(source["url"], encoded=source["is_encoded"]), offset=committed)
+        elif source["type"] == "path":
+            source_iter = self.iter_path(source["path"], offset=committed)
+        else:
+            source_iter = self.iter_telegram(source["file_id"], offset=committed)
+
+        return await self.pipe_upload(
+            source=source_iter, location=upload["location"], total_size=upload["size"], store=store, start=committed
+        )
+
+    async def iter_url(self, url: URL, offset: int = 0) -> AsyncIterator[bytes]:
+        headers = {"Range": f"bytes={offset}-"} if offset else {}
+
+        async with self._aiohttp_session.get(url, headers=headers) as resp:
+            resp.raise_for_status()
+            # server ignored Range, skip what drive already has
+            skip = offset if resp.status != 206 else 0
+
+            async for data in resp.content.iter_chunked(self.READ_SIZE):
+                if skip:
+                    if len(data) <= skip:
+                        skip -= len(data)
+                        continue
+                    data = data[skip:]
+                    skip = 0
+                yield data
+
+    async def iter_path(self, path: str, offset: int = 0) -> AsyncIterator[bytes]:
+        with open(path, "rb") as file:
+            file.seek(offset)
+            while data := await asyncio.to_thread(file.read, self.READ_SIZE):
+                yield data
+
+    @staticmethod
+    async def iter_telegram(file_id: str, offset: int = 0) -> AsyncIterator[bytes]:
+        # stream_media offsets are in 1 MiB chunks
+        skip = offset % MIB
+
+        async for data in bot.stream_media(message=file_id, offset=offset // MIB):
+            if skip:
+                data = data[skip:]
+                skip = 0
+            yield data
+
+    async def pipe_upload(
+        self, source: AsyncIterator[bytes], location: str, total_size: int, store: dict, start: int = 0
+    ) -> str | None:
+        """
+        Reads the source into a ring of chunk buffers while earlier chunks are being sent,
+        so the download from source and the upload to drive overlap.
+        """
+        free_buffers: asyncio.Queue[bytearray] = asyncio.Queue()
+        ready_chunks: asyncio.Queue[memoryview | BaseException | None] = asyncio.Queue(maxsize=self.PIPELINE_DEPTH)
+
+        # one being filled, PIPELINE_DEPTH waiting and one being uploaded
+        for _ in range(self.PIPELINE_DEPTH + 2):
+            free_buffers.put_nowait(bytearray(self.CHUNK_SIZE))
+
+        async def read_source():
+            try:
+                async for chunk in self.assemble_chunks(source, free_buffers):
+                    store["read_size"] += len(chunk)
+                    await ready_chunks.put(chunk)
+                await ready_chunks.put(None)
+            except Exception as e:
+                await ready_chunks.put(e)
+
+        reader = asyncio.create_task(read_source(), name="drive_up_reader")
+
+        upload_id = store.get("upload_id")
+        file_id = None
+        last_saved = time.monotonic()
+
+        try:
+            while (chunk := await ready_chunks.get()) is not None:
+                if isinstance(chunk, BaseException):
+                    raise chunk
+
+                await self.bandwidth.acquire(len(chunk))
+                file_id = await self.upload_chunk(location, start, chunk, total_size)
+                start += len(chunk)
+                store["uploaded_size"] = start
+                free_buffers.put_nowait(chunk.obj)
+
+                if upload_id and time.monotonic() - last_saved > self.SAVE_INTERVAL:
+                    await UPLOADS_DB.add_data({"_id": upload_id, "offset": start})
+                    last_saved = time.monotonic()
+        finally:
+            reader.cancel()
+
+        if file_id is None:
+            # no chunk finished the file, like an empty source, close the session at the bytes sent
+            file_id = await self.finish_upload(location, start)
+
+        if upload_id:
+            await UPLOADS_DB.delete_data(id=upload_id)
+
+        return file_id
+
+    async def assemble_chunks(
+        self, source: AsyncIterator[bytes], buffers: asyncio.Queue[bytearray]
+    ) -> AsyncIterator[memoryview]:
+        """
+        Packs reads from source into CHUNK_SIZE chunks, each filled in a preallocated buffer from buffers.
+        A buffer must be put back in buffers once its chunk has been used.
+        """
+        buffer = memoryview(await buffers.get())
+        filled = 0
+
+        async for data in source:
+            data = memoryview(data)
+
+            while data:
+                size = min(len(data), self.CHUNK_SIZE - filled)
+                buffer[filled : filled + size] = data[:size]
+                filled += size
+                data = data[size:]
+
+                if filled == self.CHUNK_SIZE:
+                    yield buffer
+                    buffer = memoryview(await buffers.get())
+                    filled = 0
+
+        if filled:
+            yield buffer[:filled]
+
+    @staticmethod
+    async def progress_worker(
+        store: dict, message: Message, action_str: str = "Uploading to Drive...", size_key: str = "uploaded_size"
+    ):
+        if not isinstance(message, Message):
+            return
+
+        while not store["done"]:
+            read_str = f"\nRead: {store['read_size'] / MIB:.1f} MiB" if "read_size" in store else ""
+            await progress(
+                current_size=store[size_key],
+                total_size=store["size"] or 1,
+                response=message,
+                action_str=action_str + read_str,
+            )
+            await asyncio.sleep(5)
+
+
+drive = Drive()
+
+
+async def init_task():
+    await drive.async_init()
+
+
+@BOT.register_worker(interval=60, name="drive-token-refresher")
+async def token_refresh_worker():
+    if drive.is_authenticated and drive.token_expiring(margin=drive.REFRESH_MARGIN):
+        await drive.refresh_creds(margin=drive.REFRESH_MARGIN)
@@ -0,0 +1,187 @@
+from collections import defaultdict
+
+from ub_core import BOT, CustomDB, bot
+
+from app.plugins.files.gdrive.drive import DB, drive
+
+INDEX_DB = CustomDB["DRIVE_INDEX"]
+
+INDEX_FIELDS = "id, name, mimeType, size, md5Checksum, shortcutDetails, parents"
+
+
+class DriveIndex:
+    """
+    Local copy of the drive's file metadata, built once with a full listing
+    and then kept in sync with the changes API.
+    """
+
+    def __init__(self):
+        self.files: dict[str, dict] = {}
+        self.children: defaultdict[str, set[str]] = defaultdict(set)
+        self.page_token: str | None = None
+        self.root_id: str | None = None
+
+    @property
+    def ready(self) -> bool:
+        return self.page_token is not None
+
+    async def load(self):
+        state = await DB.find_one({"_id": "drive_index_state"})
+        if not state:
+            return
+
+        async for file in INDEX_DB.find():
+            self._add(file)
+
+        self.root_id = state["root_id"]
+        self.page_token = state["page_token"]
+
+    async def reset(self):
+        self.files.clear()
+        self.children.clear()
+        self.page_token = self.root_id = None
+        await INDEX_DB.drop()
+        await DB.delete_data(id="drive_index_state")
+
+    async def build(self):
+        # token taken before listing so changes made during the crawl are replayed after it
+        start = await drive.api_request("GET", "/changes/startPageToken")
+        root = await drive.api_request("GET", "/files/root", params={"fields": "id"})
+
+        params = {
+            "q": "trashed=false",
+            "fields": f"nextPageToken, files({INDEX_FIELDS})",
+            "pageSize": 1000,
+            "corpora": "allDrives",
+            "includeItemsFromAllDrives": "true",
+            "supportsAllDrives": "true",
+        }
+        files = []
+
+        while True:
+            result = await drive.api_request("GET", params=params)
+            files.extend(result.get("files", []))
+
+            if not (page_token := result.get("nextPageToken")):
+                break
+            params["pageToken"] = page_token
+
+        await self.reset()
+
+        for file in files:
+            file["_id"] = file["id"]
+            self._add(file)
+
+        if files:
+            await INDEX_DB.insert_many(files)
+
+        self.root_id = root["id"]
+        await self.save_token(start["startPageToken"])
+        bot.log.info(f"Drive index built with {len(files)} entries.")
+
+    async def sync_changes(self):
+        params = {
+            "pageToken": self.page_token,
+            "pageSize": 1000,
+            "fields": f"nextPageToken, newStartPageToken, changes(fileId, removed, file({INDEX_FIELDS}, trashed))",
+            "includeItemsFromAllDrives": "true",
+            "supportsAllDrives": "true",
+        }
+
+        while True:
+            result = await drive.api_request("GET", "/changes", params=params)
+
+            for change in result.get("changes", []):
+                file = change.get("file")
+
+                if change.get("removed") or not file or file.get("trashed"):
+                    self._remove(change["fileId"])
+                    await INDEX_DB.delete_data(id=change["fileId"])
+                    continue
+
+                file = {key: file[key] for key in INDEX_FIELDS.split(", ") if key in file}
+                file["_id"] = file["id"]
+                self._remove(file["id"])
+                self._add(file)
+                await INDEX_DB.add_data(file)
+
+            if new_token := result.get("newStartPageToken"):
+                await self.save_token(new_token)
+                return
+
+            params["pageToken"] = result["nextPageToken"]
+
+    async def save_token(self, page_token: str):
+        self.page_token = page_token
+        await DB.add_data({"_id": "drive_index_state", "page_token": page_token, "root_id": self.root_id})
+
+    def _add(self, file: dict):
+        self.files[file["id"]] = file
+        for parent in file.get("parents", []):
+            self.children[parent].add(file["id"])
+
+    def _remove(self, file_id: str):
+        file = self.files.pop(file_id, None)
+        if not file:
+            return
+        for parent in file.get("parents", []):
+            self.children[parent].discard(file_id)
+
+    def resolve(self, file: dict) -> dict:
+        """
+        :return: The target's metadata if file is a shortcut to an indexed file, else file itself.
+        """
+        target_id = file.get("shortcutDetails", {}).get("targetId")
+        return self.files.get(target_id, file)
+
+    def list_contents(
+        self,
+        _id: bool = False,
+        limit: int = 10,
+        file_only: bool = False,
+        folder_only: bool = False,
+        search_param: str | None = None,
+    ) -> list[dict] | None:
+        """
+        Same arguments and results as Drive.list_contents, served from memory.
+        :return: None if the folder to list isn't in the index, the caller should ask the API instead.
+        """
+        if search_param is not None and _id:
+            folder_id = search_param
+        elif search_param is not None:
+            search_param = search_param.lower()
+            folder_id = None
+        else:
+            folder_id = self.root_id if drive.DRIVE_ROOT_ID == "root" else drive.DRIVE_ROOT_ID
+
+        if folder_id is None:
+            files = (file for file in self.files.values() if search_param in file["name"].lower())
+        elif folder_id == self.root_id or folder_id in self.files:
+            files = (self.files[file_id] for file_id in self.children.get(folder_id, ()))
+        else:
+            return None
+
+        if folder_only:
+            files = (file for file in files if file["mimeType"] == drive.FOLDER_MIME)
+        elif file_only:
+            files = (file for file in files if file["mimeType"] != drive.FOLDER_MIME)
+
+        return sorted(files, key=lambda file: file["name"].lower())[0:limit]
+
+
+drive_index = DriveIndex()
+
+
+async def init_task():
+    await drive_index.load()
+
+
+@BOT.register_worker(interval=60, name="drive-index-worker")
+async def drive_index_worker():
+    if not drive.is_authenticated:
+        return
+
+    if drive_index.ready:
+        await drive_index.sync_changes()
+    else:
+        await drive_index.build()
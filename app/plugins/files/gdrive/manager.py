@@ -0,0 +1,86 @@
+import asyncio
+import itertools
+import os
+import uuid
+from collections.abc import Awaitable, Callable
+
+from ub_core import BOT, Message
+from ub_core.utils import progress
+
+from app.plugins.files.gdrive.drive import drive
+
+
+class Transfer:
+    def __init__(self, name: str, size: int, func: Callable[..., Awaitable[str]], priority: int):
+        """
+        :param func: Upload coroutine function, called with a progress_key kwarg.
+        """
+        self.key = uuid.uuid4().hex[:8]
+        self.name = name
+        self.size = size
+        self.func = func
+        self.priority = priority
+        self.status = "queued"
+        self.result: asyncio.Future[str] = asyncio.get_running_loop().create_future()
+
+    @property
+    def uploaded_size(self) -> int:
+        if self.result.done():
+            return self.size
+        return drive._progress_store.get(self.key, {}).get("uploaded_size", 0)
+
+
+class TransferManager:
+    HIGH_PRIORITY = 0
+    NORMAL_PRIORITY = 1
+    WORKERS = int(os.getenv("DRIVE_WORKERS", 2))
+
+    def __init__(self):
+        self.queue: asyncio.PriorityQueue[tuple[int, int, Transfer]] = asyncio.PriorityQueue()
+        self.counter = itertools.count()
+        self.transfers: dict[str, Transfer] = {}
+
+    def submit(
+        self, name: str, func: Callable[..., Awaitable[str]], size: int = 0, priority: int = NORMAL_PRIORITY
+    ) -> Transfer:
+        """
+        Queues an upload, await Transfer.result for its link or error.
+        """
+        transfer = Transfer(name=name, size=size, func=func, priority=priority)
+        self.transfers[transfer.key] = transfer
+        # counter keeps same priority transfers in FIFO order
+        self.queue.put_nowait((priority, next(self.counter), transfer))
+        return transfer
+
+    async def worker(self):
+        _, _, transfer = await self.queue.get()
+        transfer.status = "running"
+        try:
+            transfer.result.set_result(await transfer.func(progress_key=transfer.key))
+        except asyncio.CancelledError:
+            transfer.result.cancel()
+            raise
+        except Exception as e:
+            transfer.result.set_result(f"Error:\n{e}")
+        finally:
+            self.transfers.pop(transfer.key, None)
+
+    @staticmethod
+    async def bulk_progress(transfers: list[Transfer], message: Message):
+        total_size = sum(transfer.size for transfer in transfers) or 1
+
+        while not all(transfer.result.done() for transfer in transfers):
+            finished = sum(transfer.result.done() for transfer in transfers)
+            await progress(
+                current_size=sum(transfer.uploaded_size for transfer in transfers),
+                total_size=total_size,
+                response=message,
+                action_str=f"Uploading to Drive... [{finished}/{len(transfers)} files]",
+            )
+            await asyncio.sleep(5)
+
+
+transfer_manager = TransferManager()
+
+for _worker in range(max(TransferManager.WORKERS, 1)):
+    BOT.register_worker(interval=1, name=f"drive-transfer-worker-{_worker}")(transfer_manager.worker)
@@ -0,0 +1,176 @@
+import asyncio
+import os
+from functools import partial
+
+from ub_core import CustomDB
+
+from app.plugins.files.gdrive.drive import drive
+from app.plugins.files.gdrive.manager import Transfer, transfer_manager
+
+SYNC_DB = CustomDB["DRIVE_SYNC"]
+
+# index save tasks of running syncs, referenced so they aren't garbage collected before they finish
+SAVE_TASKS: set[asyncio.Task] = set()
+
+
+async def get_remote_index(folder_id: str, refresh: bool = False) -> dict[str, dict]:
+    """
+    :return: relative path -> {id, folder, size, md5, mtime} of everything under folder_id.
+        Served from DB unless refresh is True or the folder was never synced.
+    """
+    cached = await SYNC_DB.find_one({"_id": folder_id})
+
+    if cached and not refresh:
+        return {entry["path"]: entry for entry in cached["index"]}
+
+    index = {}
+
+    for file in await drive.walk_folder(folder_id):
+        index[file["path"]] = dict(
+            path=file["path"],
+            id=file["id"],
+            folder=file["mimeType"] == drive.FOLDER_MIME,
+            size=int(file.get("size", 0)),
+            md5=file.get("md5Checksum"),
+            mtime=None,
+        )
+
+    return index
+
+
+async def save_remote_index(folder_id: str, index: dict[str, dict]):
+    # paths contain dots so the index is stored as a list instead of a dict
+    await SYNC_DB.add_data({"_id": folder_id, "index": list(index.values())})
+
+
+async def is_unchanged(local_path: str, entry: dict | None) -> bool:
+    if not entry or entry["folder"]:
+        return False
+
+    stat = os.stat(local_path)
+
+    if stat.st_size != entry["size"]:
+        return False
+
+    # same mtime as the last sync, skip hashing
+    if entry["mtime"] == stat.st_mtime:
+        return True
+
+    if entry["md5"] == await asyncio.to_thread(drive.md5sum, local_path):
+        entry["mtime"] = stat.st_mtime
+        return True
+
+    return False
+
+
+async def get_folder_id(rel_dir: str, root_id: str, index: dict[str, dict]) -> str:
+    """
+    :return: ID of the drive folder at rel_dir, creating missing folders on the way.
+    """
+    parent_id = root_id
+    path = ""
+
+    for name in filter(None, rel_dir.split(os.sep)):
+        path = os.path.join(path, name)
+        entry = index.get(path)
+
+        if not entry or not entry["folder"]:
+            folder_id = await drive.create_folder(name, parent_id)
+            entry = index[path] = dict(path=path, id=folder_id, folder=True, size=0, md5=None, mtime=None)
+
+        parent_id = entry["id"]
+
+    return parent_id
+
+
+async def sync_to_drive(
+    local_dir: str, folder_id: str, refresh: bool = False, delete: bool = False, priority: int = 1
+) -> tuple[list[Transfer], int, int]:
+    """
+    One-way mirror of local_dir into the drive folder, only changed files are uploaded.
+    :param refresh: Rebuild the remote index from drive instead of using the cached one.
+    :param delete: Trash remote files that don't exist locally.
+    :return: Queued transfers, count of unchanged files and count of trashed files.
+    """
+    index = await get_remote_index(folder_id, refresh)
+    local_paths: set[str] = set()
+    transfers: list[Transfer] = []
+    unchanged = 0
+
+    for root, _, files in os.walk(local_dir):
+        rel_root = os.path.relpath(root, local_dir)
+        rel_root = "" if rel_root == "." else rel_root
+        local_paths.add(rel_root)
+
+        if files:
+            parent_id = await get_folder_id(rel_root, folder_id, index)
+
+        for name in sorted(files):
+            local_path = os.path.join(root, name)
+            rel_path = os.path.join(rel_root, name)
+            local_paths.add(rel_path)
+            entry = index.get(rel_path)
+
+            if await is_unchanged(local_path, entry):
+                unchanged += 1
+                continue
+
+            transfers.append(
+                transfer_manager.submit(
+                    name=rel_path,
+                    func=partial(
+                        upload_and_index,
+                        local_path=local_path,
+                        rel_path=rel_path,
+                        parent_id=parent_id,
+                        index=index,
+                    ),
+                    size=os.path.getsize(local_path),
+                    priority=priority,
+                )
+            )
+
+    trashed = 0
+
+    if delete:
+        for rel_path, entry in list(index.items()):
+            if rel_path in local_paths or os.path.dirname(rel_path) not in local_paths:
+                continue
+            await drive.trash(entry["id"])
+            trashed += 1
+            for path in [p for p in index if p == rel_path or p.startswith(rel_path + os.sep)]:
+                index.pop(path)
+
+    # save folders created and hashes matched so far even if uploads fail
+    await save_remote_index(folder_id, index)
+
+    save_task = asyncio.create_task(save_index_when_done(folder_id, index, transfers), name="drive_sync_index")
+    SAVE_TASKS.add(save_task)
+    save_task.add_done_callback(SAVE_TASKS.discard)
+
+    return transfers, unchanged, trashed
+
+
+async def upload_and_index(local_path: str, rel_path: str, parent_id: str, index: dict, progress_key: str) -> str:
+    entry = index.get(rel_path)
+    existing_id = entry["id"] if entry and not entry["folder"] else None
+    stat = os.stat(local_path)
+
+    result = await drive.upload_from_path(local_path, parent_id, progress_key=progress_key, file_id=existing_id)
+
+    if result and result.startswith("http"):
+        index[rel_path] = dict(
+            path=rel_path,
+            id=drive.extract_id(result),
+            folder=False,
+            size=stat.st_size,
+            md5=await asyncio.to_thread(drive.md5sum, local_path),
+            mtime=stat.st_mtime,
+        )
+
+    return result
+
+
+async def save_index_when_done(folder_id: str, index: dict, transfers: list[Transfer]):
+    await asyncio.gather(*(transfer.result for transfer in transfers), return_exceptions=True)
+    await save_remote_index(folder_id, index)
@@ -0,0 +1,61 @@
+import asyncio
+import json
+import os
+from collections import OrderedDict
+from pathlib import Path
+
+# results of recently probed files, keyed by path, mtime and size
+PROBE_CACHE: OrderedDict[tuple[str, int, int], "MediaInfo"] = OrderedDict()
+
+PROBE_CACHE_SIZE = 256
+
+
+class MediaInfo:
+    def __init__(self, data: dict):
+        streams = data.get("streams", [])
+        video = next((stream for stream in streams if stream.get("codec_type") == "video"), {})
+
+        self.duration: int = int(float(data.get("format", {}).get("duration") or video.get("duration") or 0))
+        self.has_audio: bool = any(stream.get("codec_type") == "audio" for stream in streams)
+        self.width: int = int(video.get("width", 0))
+        self.height: int = int(video.get("height", 0))
+        self.codec: str | None = video.get("codec_name")
+
+
+async def probe(path: Path | str) -> MediaInfo:
+    """
+    Reads duration, audio presence, dimensions and codec with a single ffprobe call.
+    Results are reused until the file changes.
+    """
+    stat = os.stat(path)
+    key = (os.path.abspath(path), stat.st_mtime_ns, stat.st_size)
+
+    if key in PROBE_CACHE:
+        PROBE_CACHE.move_to_end(key)
+        return PROBE_CACHE[key]
+
+    process = await asyncio.create_subprocess_exec(
+        "ffprobe",
+        "-v",
+        "error",
+        "-print_format",
+        "json",
+        "-show_format",
+        "-show_streams",
+        str(path),
+        stdout=asyncio.subprocess.PIPE,
+        stderr=asyncio.subprocess.DEVNULL,
+    )
+    stdout, _ = await process.communicate()
+
+    try:
+        info = MediaInfo(json.loads(stdout or "{}"))
+    except (ValueError, TypeError):
+        info = MediaInfo({})
+
+    PROBE_CACHE[key] = info
+
+    if len(PROBE_CACHE) > PROBE_CACHE_SIZE:
+        PROBE_CACHE.popitem(last=False)
+
+    return info
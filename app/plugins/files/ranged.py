@@ -0,0 +1,93 @@
+import asyncio
+import os
+from collections.abc import Awaitable, Callable
+from pathlib import Path
+
+import aiohttp
+
+from app import Config
+
+MIB = 1024 * 1024
+
+RANGE_RETRIES = 3
+
+RANGE_SESSION: aiohttp.ClientSession | None = None
+
+
+async def init_task():
+    global RANGE_SESSION
+    RANGE_SESSION = aiohttp.ClientSession(connector=aiohttp.TCPConnector(limit=64))
+    Config.TASK_MANAGER.add_exit(RANGE_SESSION.close)
+
+
+async def ranged_download(
+    url: str,
+    path: Path | str,
+    size: int,
+    part_size: int,
+    state: dict,
+    headers: Callable[[], Awaitable[dict]] = None,
+):
+    """
+    Splits the file into Range requests of part_size bytes, all running at once,
+    each writing its part into a preallocated sparse file with pwrite.
+    :param state: state["downloaded"] grows by every byte written.
+    :param headers: Returns extra request headers, called on every attempt so auth tokens stay fresh.
+    """
+    fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o644)
+    try:
+        os.ftruncate(fd, size)
+        # a failed part cancels and awaits the rest, so none can pwrite after the close below
+        async with asyncio.TaskGroup() as task_group:
+            for start in range(0, size, part_size):
+                task_group.create_task(
+                    download_range(url, fd, start, min(start + part_size, size) - 1, size, state, headers)
+                )
+    except ExceptionGroup as exc_group:
+        raise exc_group.exceptions[0]
+    finally:
+        os.close(fd)
+
+
+async def download_range(
+    url: str,
+    fd: int,
+    start: int,
+    end: int,
+    size: int,
+    state: dict,
+    headers: Callable[[], Awaitable[dict]] = None,
+):
+    """
+    Downloads bytes start-end into fd, resuming from the last written byte on errors.
+    """
+    offset = start
+
+    for attempt in range(RANGE_RETRIES + 1):
+        request_headers = await headers() if headers else {}
+        request_headers["Range"] = f"bytes={offset}-{end}"
+
+        try:
+            async with RANGE_SESSION.get(url, headers=request_headers) as resp:
+                # a full response is fine only when the range is the whole file
+                if resp.status == 200 and (offset or end < size - 1):
+                    raise Exception("Server ignored the Range header.")
+
+                if resp.status not in (200, 206):
+                    raise Exception(f"Range request failed with {resp.status}: {await resp.text()}")
+
+                async for data in resp.content.iter_chunked(MIB):
+                    await asyncio.to_thread(os.pwrite, fd, data, offset)
+                    offset += len(data)
+                    state["downloaded"] += len(data)
+
+            if offset > end:
+                return
+
+        except (aiohttp.ClientError, TimeoutError):
+            if attempt == RANGE_RETRIES:
+                raise
+
+        await asyncio.sleep(2**attempt)
+
+    raise Exception(f"Range {start}-{end} ended early at {offset}.")
@@ -4,7 +4,9 @@ import shutil
 from ub_core.utils.downloader import Download, DownloadedFile
 
 from app import BOT, Config, Message, bot
+from app.plugins.files.cache import media_cache
 from app.plugins.files.download import telegram_download
+from app.plugins.files.stream import stream_url_to_tg
 from app.plugins.files.upload import upload_to_tg
 
 
@@ -13,15 +15,23 @@ async def rename(bot: BOT, message: Message):
     """
     CMD: RENAME
     INFO: Upload Files with custom name
-    FLAGS: -s for spoiler
+    FLAGS:
+        -s: spoiler
+        -stream: send a URL as a document while it downloads, without saving it to disk.
     USAGE:
         .rename [ url | reply to message ] file_name.ext
+        .rename -stream url file_name.ext
     """
     input = message.filtered_input
 
     response = await message.reply("Checking input...")
 
-    if not message.replied or not message.replied.media or not message.filtered_input:
+    replied_media = message.replied and message.replied.media
+
+    # a link needs the file name after it
+    is_url = bool(input) and not replied_media and input.startswith("http") and len(input.split(maxsplit=1)) == 2
+
+    if not input or not (replied_media or is_url):
         await response.edit(
             "Invalid input...\nReply to a message containing media or give a link and a filename with cmd."
         )
@@ -32,7 +42,7 @@ async def rename(bot: BOT, message: Message):
 
     await response.edit("Input verified....Starting Download...")
 
-    if message.replied:
+    if replied_media:
         dl_obj: None = None
         download_coro = telegram_download(
             message=message.replied, dir_name=download_path, file_name=input, response=response
@@ -43,9 +53,18 @@ async def rename(bot: BOT, message: Message):
         dl_obj: Download = await Download.setup(
             url=url, dir=download_path, message_to_edit=response, custom_file_name=file_name
         )
-        download_coro = dl_obj.download()
+        if "-stream" in message.flags:
+            download_coro = None
+        else:
+            download_coro = media_cache.download_url(dl_obj, download_path / dl_obj.file_name, dl_obj.download)
 
     try:
+        if download_coro is None:
+            await stream_url_to_tg(dl_obj=dl_obj, message=message, response=response, file_name=file_name)
+            await response.delete()
+            shutil.rmtree(download_path, ignore_errors=True)
+            return
+
         downloaded_file: DownloadedFile = await download_coro
         await upload_to_tg(file=downloaded_file, message=message, response=response)
         shutil.rmtree(download_path, ignore_errors=True)
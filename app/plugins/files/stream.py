@@ -0,0 +1,120 @@
+import asyncio
+import mimetypes
+
+from pyrogram.raw import functions
+from pyrogram.raw import types as raw_types
+from ub_core.utils import Download, progress
+
+from app import Message
+
+PART_SIZE = 512 * 1024
+
+# files above this must be sent with saveBigFilePart
+BIG_FILE_SIZE = 10 * 1024 * 1024
+
+# parts held in memory, queued and in flight together
+UPLOAD_WINDOW = 8
+
+
+async def stream_url_to_tg(dl_obj: Download, message: Message, response: Message, file_name: str = None):
+    """
+    Uploads the URL as a document while it downloads, nothing is written to disk.
+    At most UPLOAD_WINDOW parts of PART_SIZE are queued or being sent at a time,
+    plus the part being read.
+    """
+    client = message._client
+    size = dl_obj.size_bytes
+
+    if not size:
+        raise ValueError("Streaming needs the server to send the file size.")
+
+    file_name = file_name or dl_obj.file_name
+    tg_file_id = client.rnd_id()
+    total_parts = -(-size // PART_SIZE)
+    is_big = size > BIG_FILE_SIZE
+    queue: asyncio.Queue[tuple[int, bytes] | None] = asyncio.Queue()
+    # taken by the reader for each part, given back once the part is sent
+    window = asyncio.Semaphore(UPLOAD_WINDOW)
+    state = {"uploaded": 0}
+
+    async def read_parts():
+        buffer = bytearray()
+        part_index = 0
+
+        async for chunk in dl_obj.iter_chunks(PART_SIZE):
+            buffer.extend(chunk)
+
+            while len(buffer) >= PART_SIZE:
+                await window.acquire()
+                queue.put_nowait((part_index, bytes(buffer[:PART_SIZE])))
+                del buffer[:PART_SIZE]
+                part_index += 1
+
+        if buffer:
+            await window.acquire()
+            queue.put_nowait((part_index, bytes(buffer)))
+            part_index += 1
+
+        for _ in range(UPLOAD_WINDOW):
+            queue.put_nowait(None)
+
+        if part_index != total_parts:
+            raise Exception(f"Expected {total_parts} parts but the server sent {part_index}.")
+
+    async def send_parts():
+        while (item := await queue.get()) is not None:
+            part_index, data = item
+
+            if is_big:
+                query = functions.upload.SaveBigFilePart(
+                    file_id=tg_file_id, file_part=part_index, file_total_parts=total_parts, bytes=data
+                )
+            else:
+                query = functions.upload.SaveFilePart(file_id=tg_file_id, file_part=part_index, bytes=data)
+
+            await client.invoke(query)
+            state["uploaded"] += len(data)
+            # drop the part before freeing its slot, an idle sender shouldn't keep it alive
+            del item, data, query
+            window.release()
+
+    async def show_progress():
+        while True:
+            await progress(
+                current_size=state["uploaded"], total_size=size, response=response, action_str="Streaming to TG..."
+            )
+            await asyncio.sleep(5)
+
+    progress_task = asyncio.create_task(show_progress(), name="url_tg_stream_prog")
+    try:
+        # a failed part cancels the reader and the other senders
+        async with asyncio.TaskGroup() as task_group:
+            task_group.create_task(read_parts())
+            for _ in range(UPLOAD_WINDOW):
+                task_group.create_task(send_parts())
+    except ExceptionGroup as exc_group:
+        raise exc_group.exceptions[0]
+    finally:
+        progress_task.cancel()
+
+    if is_big:
+        input_file = raw_types.InputFileBig(id=tg_file_id, parts=total_parts, name=file_name)
+    else:
+        input_file = raw_types.InputFile(id=tg_file_id, parts=total_parts, name=file_name, md5_checksum="")
+
+    mime_type = dl_obj.file_response_session.headers.get("Content-Type", "").split(";")[0]
+
+    await client.invoke(
+        functions.messages.SendMedia(
+            peer=await client.resolve_peer(message.chat.id),
+            media=raw_types.InputMediaUploadedDocument(
+                file=input_file,
+                mime_type=mime_type or mimetypes.guess_type(file_name)[0] or "application/octet-stream",
+                attributes=[raw_types.DocumentAttributeFilename(file_name=file_name)],
+                force_file=True,
+            ),
+            message=file_name,
+            random_id=client.rnd_id(),
+            reply_to=raw_types.InputReplyToMessage(reply_to_msg_id=message.reply_id) if message.reply_id else None,
+        )
+    )
@@ -4,27 +4,46 @@ import os
 from functools import partial
 from typing import Union
 
-from pyrogram.types import ReplyParameters
-from ub_core.utils import Download, DownloadedFile, MediaType, check_audio, get_duration, progress, take_ss
+from pyrogram.errors import FloodWait
+from pyrogram.types import InputMediaPhoto, InputMediaVideo, ReplyParameters
+from ub_core.utils import Download, DownloadedFile, MediaType, progress, take_ss
 
-from app import BOT, Config, Message
+from app import BOT, Config, Message, bot, extra_config
+from app.plugins.files.cache import media_cache
+from app.plugins.files.probe import probe
+from app.plugins.files.stream import stream_url_to_tg
+from app.plugins.files.upload_index import find_upload, forget_upload, save_upload
+from app.rate_limit import RateLimiter, call_with_limit
 
 UPLOAD_TYPES = Union[BOT.send_audio, BOT.send_document, BOT.send_photo, BOT.send_video]
 
+# one send a second in bulk mode, slowed down on FloodWait
+SEND_LIMITER = RateLimiter(rate=1, name="bulk upload")
+
+MEDIA_GROUP_SIZE = 10
+
 
 async def video_upload(bot: BOT, file: DownloadedFile, has_spoiler: bool) -> UPLOAD_TYPES:
-    thumb = await take_ss(file.path, path=file.path)
-    if not await check_audio(file.path):
+    thumb, info = await asyncio.gather(take_ss(file.path, path=file.path), probe(file.path))
+    if not info.has_audio:
         return partial(
             bot.send_animation,
             thumb=thumb,
             unsave=True,
             animation=file.path,
-            duration=await get_duration(file.path),
+            duration=info.duration,
+            width=info.width,
+            height=info.height,
             has_spoiler=has_spoiler,
         )
     return partial(
-        bot.send_video, thumb=thumb, video=file.path, duration=await get_duration(file.path), has_spoiler=has_spoiler
+        bot.send_video,
+        thumb=thumb,
+        video=file.path,
+        duration=info.duration,
+        width=info.width,
+        height=info.height,
+        has_spoiler=has_spoiler,
     )
 
 
@@ -33,7 +52,7 @@ async def photo_upload(bot: BOT, file: DownloadedFile, has_spoiler: bool) -> UPL
 
 
 async def audio_upload(bot: BOT, file: DownloadedFile, *_, **__) -> UPLOAD_TYPES:
-    return partial(bot.send_audio, audio=file.path, duration=await get_duration(file=file.path))
+    return partial(bot.send_audio, audio=file.path, duration=(await probe(file.path)).duration)
 
 
 async def doc_upload(bot: BOT, file: DownloadedFile, *_, **__) -> UPLOAD_TYPES:
@@ -66,10 +85,12 @@ async def upload(bot: BOT, message: Message):
     FLAGS:
         -d: to upload as doc.
         -s: spoiler.
-        -bulk: for folder upload.
+        -bulk: for folder upload, photos and videos are sent as albums unless -d.
         -r: file name regex [ to be used with -bulk only ]
+        -stream: send a URL as a document while it downloads, without saving it to disk.
     USAGE:
         .upload [-d] URL | Path to File | CMD
+        .upload -stream URL
         .upload -bulk downloads/videos
         .upload -bulk -d -s downloads/videos
         .upload -bulk -r -s downloads/videos/*.mp4 (only uploads mp4)
@@ -83,19 +104,29 @@ async def upload(bot: BOT, message: Message):
     response = await message.reply("checking input...")
 
     if input in Config.CMD_DICT:
-        await message.reply_document(document=Config.CMD_DICT[input].path.as_posix())
+        path = Config.CMD_DICT[input].path.as_posix()
+        if not await resend_uploaded(file=DownloadedFile(file=path), message=message, as_document=True, caption=""):
+            await save_upload(path, True, await message.reply_document(document=path))
         await response.delete()
         return
 
     elif input.startswith("http") and not file_exists(input):
         try:
-            async with Download(url=input, dir=Config.TEMP_DOWNLOAD_PATH(), message_to_edit=response) as dl_obj:
+            download_dir = Config.TEMP_DOWNLOAD_PATH()
+            async with Download(url=input, dir=download_dir, message_to_edit=response) as dl_obj:
                 if size_over_limit(dl_obj.size, client=bot):
                     await response.edit("<b>Aborted</b>, File size exceeds TG Limits!!!")
                     return
 
+                if "-stream" in message.flags:
+                    await stream_url_to_tg(dl_obj=dl_obj, message=message, response=response)
+                    await response.delete()
+                    return
+
                 await response.edit("URL detected in input, Starting Download....")
-                file: DownloadedFile = await dl_obj.download()
+                file: DownloadedFile = await media_cache.download_url(
+                    dl_obj, download_dir / dl_obj.file_name, dl_obj.download
+                )
 
         except asyncio.exceptions.CancelledError:
             await response.edit("Cancelled...")
@@ -129,6 +160,10 @@ async def upload(bot: BOT, message: Message):
 
 
 async def bulk_upload(message: Message, response: Message):
+    """
+    Prepares upcoming files (thumbnails, durations) while earlier ones upload,
+    sends up to UPLOAD_CONCURRENCY files at once and groups photos/videos into albums of 10.
+    """
     if "-r" in message.flags:
         path_regex = message.filtered_input
     else:
@@ -142,41 +177,191 @@ async def bulk_upload(message: Message, response: Message):
 
     await response.edit(f"Preparing to upload {len(file_list)} files.")
 
-    for file in file_list:
+    files = []
+
+    for file in sorted(file_list):
         file_info = DownloadedFile(file=file)
 
         if size_over_limit(file_info.size, client=message._client):
             await response.reply(f"Skipping {file_info.name} due to size exceeding limit.")
             continue
 
-        temp_resp = await response.reply(f"starting to upload `{file_info.name}`")
+        files.append(file_info)
+
+    prepare_semaphore = asyncio.Semaphore(extra_config.UPLOAD_CONCURRENCY * 2)
+    send_semaphore = asyncio.Semaphore(extra_config.UPLOAD_CONCURRENCY)
+
+    # preparation of every file starts now, bounded by its semaphore
+    prepare_tasks = [
+        asyncio.create_task(prepare_upload(file, message, prepare_semaphore), name="bulk_upload_prep")
+        for file in files
+    ]
+
+    send_tasks = []
+    errors: list[str] = []
+    media_group: list[tuple[DownloadedFile, UPLOAD_TYPES, InputMediaPhoto | InputMediaVideo]] = []
+    group_media = "-d" not in message.flags
+
+    def send_single(file: DownloadedFile, upload_method: UPLOAD_TYPES):
+        send_tasks.append(asyncio.create_task(send_bulk_file(file, upload_method, message, response, send_semaphore)))
+
+    def send_group():
+        media = [input_media for *_, input_media in media_group]
+        send_tasks.append(asyncio.create_task(send_media_group(media, message, send_semaphore)))
+
+    for file, prepare_task in zip(files, prepare_tasks):
+        try:
+            upload_method = await prepare_task
+        except Exception as e:
+            # one unreadable file shouldn't stop the rest of the batch
+            errors.append(f"{file.name}: {e}")
+            continue
+
+        if group_media and (input_media := get_input_media(file, upload_method)):
+            media_group.append((file, upload_method, input_media))
+
+            if len(media_group) == MEDIA_GROUP_SIZE:
+                send_group()
+                media_group = []
+            continue
+
+        send_single(file, upload_method)
+
+    # albums need at least 2 items
+    if len(media_group) == 1:
+        send_single(*media_group[0][:2])
+    elif media_group:
+        send_group()
 
-        await upload_to_tg(file=file_info, message=message, response=temp_resp)
-        await asyncio.sleep(3)
+    results = await asyncio.gather(*send_tasks, return_exceptions=True)
+    errors.extend(str(result) for result in results if isinstance(result, BaseException))
+
+    if errors:
+        await response.edit(f"Uploaded with {len(errors)} errors:\n" + "\n".join(errors))
+        return
 
     await response.delete()
 
 
-async def upload_to_tg(file: DownloadedFile, message: Message, response: Message):
-    progress_args = (response, "Uploading...", file.path)
+async def prepare_upload(file: DownloadedFile, message: Message, semaphore: asyncio.Semaphore) -> UPLOAD_TYPES:
+    async with semaphore:
+        return await get_upload_method(file, message)
+
 
+async def get_upload_method(file: DownloadedFile, message: Message) -> UPLOAD_TYPES:
     if "-d" in message.flags:
-        upload_method = partial(message._client.send_document, document=file.path, disable_content_type_detection=True)
-    else:
-        upload_method: UPLOAD_TYPES = await FILE_TYPE_MAP[file.type](
-            bot=message._client, file=file, has_spoiler="-s" in message.flags
+        return partial(message._client.send_document, document=file.path, disable_content_type_detection=True)
+
+    return await FILE_TYPE_MAP[file.type](bot=message._client, file=file, has_spoiler="-s" in message.flags)
+
+
+def get_input_media(file: DownloadedFile, upload_method: partial) -> InputMediaPhoto | InputMediaVideo | None:
+    """
+    :return: Album entry for photos and videos, None for everything that can't be grouped.
+    """
+    kwargs = upload_method.keywords
+
+    if upload_method.func.__name__ == "send_photo":
+        return InputMediaPhoto(media=kwargs["photo"], caption=file.name, has_spoiler=kwargs["has_spoiler"])
+
+    if upload_method.func.__name__ == "send_video":
+        return InputMediaVideo(
+            media=kwargs["video"],
+            thumb=kwargs["thumb"],
+            duration=kwargs["duration"],
+            width=kwargs["width"],
+            height=kwargs["height"],
+            caption=file.name,
+            has_spoiler=kwargs["has_spoiler"],
+        )
+
+
+async def send_bulk_file(
+    file: DownloadedFile,
+    upload_method: UPLOAD_TYPES,
+    message: Message,
+    response: Message,
+    semaphore: asyncio.Semaphore,
+):
+    async with semaphore:
+        temp_resp = await response.reply(f"starting to upload `{file.name}`")
+        await call_with_limit(
+            SEND_LIMITER,
+            partial(upload_to_tg, file=file, message=message, response=temp_resp, upload_method=upload_method),
+        )
+
+
+async def send_media_group(media: list, message: Message, semaphore: asyncio.Semaphore):
+    async with semaphore:
+        await call_with_limit(
+            SEND_LIMITER,
+            partial(
+                message._client.send_media_group,
+                chat_id=message.chat.id,
+                media=media,
+                reply_parameters=ReplyParameters(message_id=message.reply_id),
+            ),
         )
 
+
+async def upload_to_tg(
+    file: DownloadedFile, message: Message, response: Message, upload_method: UPLOAD_TYPES = None
+):
+    """
+    :param upload_method: Already prepared send method, built from the file and flags if not given.
+    """
+    progress_args = (response, "Uploading...", file.path)
+    as_document = "-d" in message.flags
+
+    if await resend_uploaded(file=file, message=message, as_document=as_document):
+        await response.delete()
+        return
+
+    if upload_method is None:
+        upload_method = await get_upload_method(file, message)
+
     try:
-        await upload_method(
+        sent_message = await upload_method(
             chat_id=message.chat.id,
             reply_parameters=ReplyParameters(message_id=message.reply_id),
             progress=progress,
             progress_args=progress_args,
             caption=file.name,
         )
+        await save_upload(file.path, as_document, sent_message)
         await response.delete()
 
     except asyncio.exceptions.CancelledError:
         await response.edit("Cancelled....")
         raise
+
+
+async def resend_uploaded(file: DownloadedFile, message: Message, as_document: bool, caption: str = None) -> bool:
+    """
+    Sends the file_id saved from an earlier upload of identical content.
+    :return: False if the content wasn't uploaded before or its file_id no longer works.
+    """
+    entry = await find_upload(file.path, as_document)
+
+    if not entry:
+        return False
+
+    kwargs = {entry["method"]: entry["file_id"]}
+
+    if "-s" in message.flags and entry["method"] in ("photo", "video", "animation"):
+        kwargs["has_spoiler"] = True
+
+    try:
+        await getattr(message._client, f"send_{entry['method']}")(
+            chat_id=message.chat.id,
+            reply_parameters=ReplyParameters(message_id=message.reply_id),
+            caption=file.name if caption is None else caption,
+            **kwargs,
+        )
+        return True
+    except FloodWait:
+        raise
+    except Exception:
+        # expired or deleted media, upload it again
+        await forget_upload(entry)
+        return False
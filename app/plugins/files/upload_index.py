@@ -0,0 +1,76 @@
+import asyncio
+import hashlib
+import os
+from collections import OrderedDict
+from pathlib import Path
+
+from ub_core.utils import get_tg_media_details
+
+from app import CustomDB, Message
+
+UPLOAD_INDEX = CustomDB["UPLOAD_INDEX"]
+
+# content hash + upload mode + file name -> {method, file_id}
+UPLOADED_FILES: dict[str, dict] = {}
+
+# (path, mtime, size) -> sha256 of recently hashed files
+HASH_CACHE: OrderedDict[tuple[str, int, int], str] = OrderedDict()
+
+HASH_CACHE_SIZE = 1024
+
+
+async def init_task():
+    async for entry in UPLOAD_INDEX.find():
+        UPLOADED_FILES[entry["_id"]] = entry
+
+
+def hash_file(path: Path | str) -> str:
+    sha256 = hashlib.sha256()
+    with open(path, "rb") as file:
+        while data := file.read(1024 * 1024):
+            sha256.update(data)
+    return sha256.hexdigest()
+
+
+async def content_hash(path: Path | str) -> str:
+    """
+    :return: sha256 of the file, only re-read when its path, mtime or size changed.
+    """
+    stat = os.stat(path)
+    key = (os.path.abspath(path), stat.st_mtime_ns, stat.st_size)
+
+    if key not in HASH_CACHE:
+        HASH_CACHE[key] = await asyncio.to_thread(hash_file, path)
+        if len(HASH_CACHE) > HASH_CACHE_SIZE:
+            HASH_CACHE.popitem(last=False)
+
+    HASH_CACHE.move_to_end(key)
+    return HASH_CACHE[key]
+
+
+async def get_index_key(path: Path | str, as_document: bool) -> str:
+    # the same content sent as a document and as media gives different file_ids,
+    # and a file_id keeps the name it was sent with, so a renamed copy needs its own upload
+    return f"{await content_hash(path)}:{'document' if as_document else 'media'}:{os.path.basename(path)}"
+
+
+async def find_upload(path: Path | str, as_document: bool) -> dict | None:
+    return UPLOADED_FILES.get(await get_index_key(path, as_document))
+
+
+async def save_upload(path: Path | str, as_document: bool, sent_message: Message):
+    if not (sent_message and sent_message.media):
+        return
+
+    entry = {
+        "_id": await get_index_key(path, as_document),
+        "method": sent_message.media.value,
+        "file_id": get_tg_media_details(sent_message).file_id,
+    }
+    UPLOADED_FILES[entry["_id"]] = entry
+    await UPLOAD_INDEX.add_data(entry)
+
+
+async def forget_upload(entry: dict):
+    UPLOADED_FILES.pop(entry["_id"], None)
+    await UPLOAD_INDEX.delete_data(id=entry["_id"])
@@ -16,6 +16,8 @@ from pyrogram.utils import FileId
 from ub_core import utils as core_utils
 
 from app import BOT, Config, Message, bot, extra_config
+from app.plugins.files.cache import media_cache
+from app.plugins.files.probe import probe
 
 EMOJIS = ("☕", "🤡", "🙂", "🤔", "🔪", "😂", "💀")
 
@@ -49,7 +51,7 @@ def resize_photo(input_file: BytesIO) -> BytesIO:
 
 
 async def photo_kang(message: Message, **_) -> tuple[str, None]:
-    file = await message.download(in_memory=True)
+    file = await media_cache.read_tg(message)
     file.seek(0)
     resized_file = await asyncio.to_thread(resize_photo, file)
     return await save_sticker(resized_file), None
@@ -67,11 +69,11 @@ async def video_kang(message: Message, ff=False) -> tuple[str, None]:
 
     download_path.mkdir(parents=True, exist_ok=True)
 
-    await message.download(str(input_file))
+    await media_cache.download_tg(message, download_path, file_name=input_file.name)
 
     duration = getattr(video, "duration", None)
     if not duration:
-        duration = await core_utils.get_duration(file=str(input_file))
+        duration = (await probe(input_file)).duration
 
     await resize_video(input_file=input_file, output_file=output_file, duration=duration, ff=ff)
 
@@ -110,7 +112,7 @@ async def sticker_kang(message: Message, **_) -> tuple[str, str]:
         return sticker.file_id, sticker.emoji
 
     # invalid sticker needs to be saved and added manually
-    file_id = await save_sticker(await message.download(in_memory=True))
+    file_id = await save_sticker(await media_cache.read_tg(message))
     return file_id, sticker.emoji
 
 
@@ -11,6 +11,8 @@ from ub_core import Config
 from ub_core import utils as core_utils
 
 from app import BOT, Message, bot, extra_config
+from app.plugins.files.cache import media_cache
+from app.plugins.files.probe import probe
 from app.plugins.tg_tools.kang import resize_photo, resize_video
 
 EMOJIS = ("☕", "🤡", "🙂", "🤔", "🔪", "😂", "💀")
@@ -45,7 +47,7 @@ async def photo_kang(message: Message, **_) -> dict:
     download_path = Config.TEMP_DOWNLOAD_PATH()
     download_path.mkdir()
     input_file = download_path / "photo.jpg"
-    await message.download(input_file)
+    await media_cache.download_tg(message, download_path, file_name=input_file.name)
     file = await asyncio.to_thread(resize_photo, input_file)
     return dict(cmd="/newpack", limit=120, is_video=False, file=file, path=download_path)
 
@@ -60,10 +62,10 @@ async def video_kang(message: Message, ff=False) -> dict:
     input_file = download_path / "input.mp4"
     output_file = download_path / "sticker.webm"
 
-    await message.download(input_file)
+    await media_cache.download_tg(message, download_path, file_name=input_file.name)
 
     if not hasattr(video, "duration"):
-        duration = await core_utils.get_duration(file=input_file)
+        duration = (await probe(input_file)).duration
     else:
         duration = video.duration
     await resize_video(input_file=input_file, output_file=output_file, duration=duration, ff=ff)
@@ -86,7 +88,7 @@ async def sticker_kang(message: Message, **_) -> dict:
         raise TypeError("Animated Stickers Not Supported.")
 
     if sticker.is_video:
-        input_file: BytesIO = await message.download(in_memory=True)
+        input_file: BytesIO = await media_cache.read_tg(message)
         input_file.seek(0)
         return dict(cmd="/newvideo", emoji=emoji, is_video=True, file=input_file, limit=50)
 
@@ -1,22 +1,52 @@
 import asyncio
-from collections import defaultdict
+from collections import OrderedDict, defaultdict, deque
 
 from pyrogram import filters
 from pyrogram.enums import ChatType, ParseMode
 from pyrogram.errors import MessageIdInvalid
+from ub_core.utils import get_tg_media_details
 from ub_core.utils.helpers import get_name
 
 from app import BOT, CustomDB, Message, bot, extra_config
+from app.rate_limit import RateLimiter, call_with_limit
 
 SETTINGS = CustomDB["COMMON_SETTINGS"]
 
-MESSAGE_CACHE: dict[int, list[Message]] = defaultdict(list)
-FLOOD_LIST: set[int] = set()
+# messages waiting to be logged, written before queueing and removed once logged
+LOGGER_SPOOL = CustomDB["LOGGER_SPOOL"]
+
+# per chat ring buffers of messages waiting to be logged
+MESSAGE_CACHE: dict[int, deque[Message]] = {}
+# chats with pending messages, served round-robin
+ACTIVE_CHATS: deque[int] = deque()
+# messages dropped per chat because its buffer or the global cap was full
+OVERFLOW_COUNT: defaultdict[int, int] = defaultdict(int)
+QUEUED_MESSAGES: int = 0
+# rough memory held by the queued messages, capped by LOGGER_QUEUE_MAX_MB
+QUEUED_BYTES: int = 0
+# estimated size of a message object apart from its text, the users and chats in it make up most of it
+MESSAGE_OVERHEAD = 2 * 1024
+NEW_MESSAGE = asyncio.Event()
+# (chat_id, message_id) of the batch the worker is logging right now
+LOGGING_IDS: set[tuple[int, int]] = set()
+
+# recent incoming PMs by message id, to repost them when deleted without fetching anything
+PM_INDEX: OrderedDict[int, dict] = OrderedDict()
+PM_INDEX_BYTES: int = 0
+# rough memory budget of PM_INDEX
+PM_INDEX_MAX_BYTES = 4 * 1024 * 1024
+
+# forward_messages takes up to 100 IDs per call, also the most taken from a chat per turn
+FORWARD_BATCH_SIZE = 100
 
 LAST_PM_ID: int = 0
 CHAT_TYPES = (ChatType.GROUP, ChatType.SUPERGROUP)
 
 
+# ~20 messages a minute is what telegram allows in a group
+RATE_LIMITER = RateLimiter(rate=1 / 3, burst=5, name="logger")
+
+
 async def init_task():
     tag_check = await SETTINGS.find_one({"_id": "tag_logger_switch"})
     pm_check = await SETTINGS.find_one({"_id": "pm_logger_switch"})
@@ -25,6 +55,11 @@ async def init_task():
     if pm_check:
         extra_config.PM_LOGGER = pm_check["value"]
 
+    try:
+        await replay_spool()
+    except Exception as e:
+        bot.log.error(f"Logger spool replay failed: {e}", exc_info=True)
+
 
 async def log_filter(_, bot: BOT, message: Message) -> bool:
     # skip service messages
@@ -58,47 +93,289 @@ async def log_filter(_, bot: BOT, message: Message) -> bool:
 
 @bot.on_message(filters=filters.create(log_filter))
 async def message_cacher(bot: BOT, message: Message):
-    chat_id = message.chat.id
+    if message.chat.type == ChatType.PRIVATE:
+        index_pm(message)
 
-    if len(MESSAGE_CACHE[chat_id]) >= 10 and chat_id not in FLOOD_LIST:
-        bot.log.error(f"Message not Logged from chat: {get_name(message.chat)}")
-        FLOOD_LIST.add(chat_id)
-        return
+    await spool_message(message)
+
+    if dropped := cache_message(message):
+        await ack_spool([dropped])
 
-    FLOOD_LIST.discard(chat_id)
-    MESSAGE_CACHE[chat_id].append(message)
     message.continue_propagation()
 
 
-@BOT.register_worker(interval=10, name="pm-tag-worker")
+def cache_message(message: Message) -> Message | None:
+    """
+    :return: The message dropped to make room, if any.
+    """
+    global QUEUED_MESSAGES, QUEUED_BYTES
+    chat_id = message.chat.id
+    size = get_message_size(message)
+
+    if (
+        QUEUED_MESSAGES >= extra_config.LOGGER_QUEUE_LIMIT
+        or QUEUED_BYTES + size > extra_config.LOGGER_QUEUE_MAX_MB * 1024 * 1024
+    ):
+        record_overflow(message)
+        return message
+
+    queue = MESSAGE_CACHE.get(chat_id)
+
+    if queue is None:
+        queue = MESSAGE_CACHE[chat_id] = deque(maxlen=extra_config.LOGGER_CHAT_CAPACITY)
+        ACTIVE_CHATS.append(chat_id)
+
+    dropped = None
+
+    # a full ring buffer drops its oldest message
+    if len(queue) == queue.maxlen:
+        dropped = queue[0]
+        QUEUED_BYTES -= get_message_size(dropped)
+        record_overflow(dropped)
+    else:
+        QUEUED_MESSAGES += 1
+
+    QUEUED_BYTES += size
+    queue.append(message)
+    NEW_MESSAGE.set()
+    return dropped
+
+
+def get_message_size(message: Message) -> int:
+    text = message.text or message.caption or ""
+    return len(text) + MESSAGE_OVERHEAD
+
+
+def record_overflow(message: Message):
+    OVERFLOW_COUNT[message.chat.id] += 1
+    if OVERFLOW_COUNT[message.chat.id] % 50 == 1:
+        bot.log.error(
+            f"Logger overflow, {OVERFLOW_COUNT[message.chat.id]} messages not Logged from chat: "
+            f"{get_name(message.chat)}"
+        )
+
+
+@BOT.register_worker(interval=1, name="pm-tag-worker")
 async def pm_tag_worker():
-    if not (extra_config.TAG_LOGGER or extra_config.PM_LOGGER):
-        return
+    """
+    Logs up to FORWARD_BATCH_SIZE messages from each chat in turn,
+    so a busy chat can't hold back the others.
+    """
+    global QUEUED_MESSAGES, QUEUED_BYTES
 
-    for key, val in MESSAGE_CACHE.copy().items():
-        if not val:
-            continue
+    while True:
+        await NEW_MESSAGE.wait()
+
+        while ACTIVE_CHATS:
+            chat_id = ACTIVE_CHATS.popleft()
+            queue = MESSAGE_CACHE[chat_id]
+            messages = [queue.popleft() for _ in range(min(len(queue), FORWARD_BATCH_SIZE))]
+            QUEUED_MESSAGES -= len(messages)
+            QUEUED_BYTES -= sum(map(get_message_size, messages))
+
+            if queue:
+                ACTIVE_CHATS.append(chat_id)
+            else:
+                del MESSAGE_CACHE[chat_id]
+
+            batch_ids = {(chat_id, message.id) for message in messages}
+            LOGGING_IDS.update(batch_ids)
 
-        for msg in val:
             try:
-                await log_message(msg)
+                await log_messages(messages)
             except Exception as e:
                 bot.log.error(e, exc_info=True)
             finally:
-                MESSAGE_CACHE[key].remove(msg)
+                LOGGING_IDS.difference_update(batch_ids)
 
-            await asyncio.sleep(2)
+            # failed ones are acked too, replaying them would most likely fail again
+            await ack_spool(messages)
 
-    new_data = {k: v for k, v in MESSAGE_CACHE.items() if v}
-    MESSAGE_CACHE.clear()
-    MESSAGE_CACHE.update(new_data)
+        NEW_MESSAGE.clear()
 
 
-def get_info_to_log(message: Message) -> str | None:
-    if message.sender_chat:
-        mention, user_id = message.sender_chat.title, message.sender_chat.id
+def index_pm(message: Message):
+    global PM_INDEX_BYTES
+
+    text = message.text or message.caption
+    media = get_tg_media_details(message) if message.media else None
+    file_id = getattr(media, "file_id", None)
+
+    # polls, locations etc. have nothing to repost
+    if not (text or file_id):
+        return
+
+    mention, user_id = get_sender(message)
+    entry = {
+        "chat_id": message.chat.id,
+        "sender": f"{mention} [{user_id}]",
+        "text": text.html if text else None,
+        "file_id": file_id,
+    }
+    # ids and other fields are small next to the text
+    entry["size"] = len(entry["text"] or "") + 200
+
+    PM_INDEX[message.id] = entry
+    PM_INDEX_BYTES += entry["size"]
+
+    while PM_INDEX_BYTES > PM_INDEX_MAX_BYTES:
+        _, old_entry = PM_INDEX.popitem(last=False)
+        PM_INDEX_BYTES -= old_entry["size"]
+
+
+@bot.on_deleted_messages()
+async def deleted_pm_logger(bot: BOT, messages: list[Message]):
+    """
+    Reposts deleted PMs from PM_INDEX to the log chat.
+    """
+    global PM_INDEX_BYTES
+
+    for message in messages:
+        entry = PM_INDEX.get(message.id)
+
+        # PM deletions come without a chat, channel ones have their own id sequence
+        if not entry or (message.chat and message.chat.id != entry["chat_id"]):
+            continue
+
+        PM_INDEX.pop(message.id)
+        PM_INDEX_BYTES -= entry["size"]
+
+        # still queued or being logged, log_messages will copy it with a deleted note
+        if (entry["chat_id"], message.id) in LOGGING_IDS or any(
+            msg.id == message.id for msg in MESSAGE_CACHE.get(entry["chat_id"], ())
+        ):
+            continue
+
+        try:
+            await log_deleted_pm(entry)
+        except Exception as e:
+            bot.log.error(e, exc_info=True)
+
+
+async def log_deleted_pm(entry: dict):
+    header = f"#PM_DELETED\n{entry['sender']}"
+    thread_id = extra_config.PM_LOGGER_THREAD_ID
+
+    if entry["file_id"]:
+        caption = f"{header}\n\n{entry['text']}" if entry["text"] else header
+        await call_with_limit(
+            RATE_LIMITER,
+            lambda: bot.send_cached_media(
+                chat_id=extra_config.MESSAGE_LOGGER_CHAT,
+                file_id=entry["file_id"],
+                caption=caption,
+                message_thread_id=thread_id,
+                parse_mode=ParseMode.HTML,
+            ),
+        )
+        return
+
+    await call_with_limit(
+        RATE_LIMITER,
+        lambda: bot.send_message(
+            chat_id=extra_config.MESSAGE_LOGGER_CHAT,
+            text=f"{header}\n\n{entry['text']}",
+            message_thread_id=thread_id,
+            parse_mode=ParseMode.HTML,
+        ),
+    )
+
+
+def get_spool_id(chat_id: int, message_id: int) -> str:
+    return f"{chat_id}:{message_id}"
+
+
+async def spool_message(message: Message):
+    mention, user_id = get_sender(message)
+    await LOGGER_SPOOL.add_data(
+        {
+            "_id": get_spool_id(message.chat.id, message.id),
+            "chat_id": message.chat.id,
+            "message_id": message.id,
+            "is_pm": message.chat.type == ChatType.PRIVATE,
+            "sender": f"{mention} [{user_id}]",
+            # enough to still log a text message that gets deleted before a restart finishes
+            "text": message.text.html if message.text else None,
+        }
+    )
+
+
+async def ack_spool(messages: list[Message]):
+    spool_ids = [get_spool_id(message.chat.id, message.id) for message in messages]
+    await LOGGER_SPOOL.delete_many({"_id": {"$in": spool_ids}})
+
+
+async def replay_spool():
+    """
+    Queues messages left in the spool by a crash or restart,
+    the ones deleted in the meantime are logged from their saved copy.
+    """
+    spooled: dict[int, dict[int, dict]] = defaultdict(dict)
+
+    async for entry in LOGGER_SPOOL.find():
+        spooled[entry["chat_id"]][entry["message_id"]] = entry
+
+    for chat_id, entries in spooled.items():
+        # a blocked user or a deleted chat shouldn't hold back the other chats
+        try:
+            await replay_chat_spool(chat_id, entries)
+        except Exception as e:
+            bot.log.error(f"Logger spool replay failed for chat {chat_id}: {e}")
+
+
+async def replay_chat_spool(chat_id: int, entries: dict[int, dict]):
+    message_ids = list(entries)
+
+    # get_messages takes up to 200 ids per call
+    for index in range(0, len(message_ids), 200):
+        messages = await bot.get_messages(chat_id=chat_id, message_ids=message_ids[index : index + 200])
+
+        for message in messages:
+            entry = entries.get(message.id)
+
+            if not entry:
+                continue
+
+            if not message.empty:
+                cache_message(Message(message=message))
+                continue
+
+            await log_spooled_copy(entry)
+            await LOGGER_SPOOL.delete_data(id=entry["_id"])
+
+
+async def log_spooled_copy(entry: dict):
+    thread_id = extra_config.PM_LOGGER_THREAD_ID if entry["is_pm"] else extra_config.TAG_LOGGER_THREAD_ID
+    header = f"#{'PM' if entry['is_pm'] else 'TAG'}\n{entry['sender']}\n"
+
+    if entry["text"]:
+        text = f"{header}\n{entry['text']}\n\n<i>This message was deleted by sender.</i>"
     else:
-        mention, user_id = message.from_user.mention(style=ParseMode.HTML), message.from_user.id
+        text = f"{header}\n<i>A media message was deleted by sender before it could be logged.</i>"
+
+    await call_with_limit(
+        RATE_LIMITER,
+        lambda: bot.send_message(
+            chat_id=extra_config.MESSAGE_LOGGER_CHAT,
+            text=text,
+            message_thread_id=thread_id,
+            parse_mode=ParseMode.HTML,
+        ),
+    )
+
+
+def get_sender(message: Message) -> tuple[str, int]:
+    if message.sender_chat:
+        return message.sender_chat.title, message.sender_chat.id
+    return message.from_user.mention(style=ParseMode.HTML), message.from_user.id
+
+
+def get_info_to_log(messages: list[Message]) -> str | None:
+    """
+    :return: One header for a batch of messages from a chat.
+    """
+    message = messages[0]
+    mention, user_id = get_sender(message)
 
     if message.chat.type == ChatType.PRIVATE:
         global LAST_PM_ID
@@ -107,59 +384,105 @@ def get_info_to_log(message: Message) -> str | None:
             return f"#PM\n{mention} [{user_id}]"
         return None
 
+    senders = dict(get_sender(msg) for msg in messages)
+    sender_str = ", ".join(f"{mention} [{user_id}]" for mention, user_id in senders.items())
+    count_str = f" ({len(messages)} messages)" if len(messages) > 1 else ""
+
     return (
-        f"#TAG\n{mention} [{user_id}]\nMessage: \n<a href='{message.link}'>{message.chat.title}</a> ({message.chat.id})"
+        f"#TAG\n{sender_str}\nMessage{count_str}: \n"
+        f"<a href='{message.link}'>{message.chat.title}</a> ({message.chat.id})"
     )
 
 
-async def log_message(message: Message) -> None:
+async def log_messages(messages: list[Message]) -> None:
+    """
+    Logs messages from one chat under a single header,
+    forwarding up to FORWARD_BATCH_SIZE of them per call.
+    """
+    chat = messages[0].chat
+
     # PM
-    if message.chat.type == ChatType.PRIVATE:
-        reply_to_message = None
+    if chat.type == ChatType.PRIVATE:
         thread_id = extra_config.PM_LOGGER_THREAD_ID
     # Tag
     else:
-        reply_to_message = message.reply_to_message
         thread_id = extra_config.TAG_LOGGER_THREAD_ID
 
-    extra_info = get_info_to_log(message)
+    extra_info = get_info_to_log(messages)
     if extra_info:
-        await bot.send_message(
-            chat_id=extra_config.MESSAGE_LOGGER_CHAT,
-            text=extra_info,
-            message_thread_id=thread_id,
-            parse_mode=ParseMode.HTML,
+        await call_with_limit(
+            RATE_LIMITER,
+            lambda: bot.send_message(
+                chat_id=extra_config.MESSAGE_LOGGER_CHAT,
+                text=extra_info,
+                message_thread_id=thread_id,
+                parse_mode=ParseMode.HTML,
+            ),
         )
-        await asyncio.sleep(1)
 
-    to_forward_ids = [message.id]
+    to_forward_ids = []
 
-    if reply_to_message:
-        to_forward_ids.insert(0, reply_to_message.id)
+    for message in messages:
+        if chat.type != ChatType.PRIVATE and message.reply_to_message:
+            to_forward_ids.append(message.reply_to_message.id)
+        to_forward_ids.append(message.id)
+
+    # several tags may reply to the same message
+    to_forward_ids = list(dict.fromkeys(to_forward_ids))
+
+    for index in range(0, len(to_forward_ids), FORWARD_BATCH_SIZE):
+        await forward_or_copy(messages, to_forward_ids[index : index + FORWARD_BATCH_SIZE], thread_id)
+
+
+async def forward_or_copy(messages: list[Message], to_forward_ids: list[int], thread_id: int | None):
+    """
+    Forwards the IDs in one call and copies only the ones that couldn't be forwarded.
+    """
+    chat_id = messages[0].chat.id
 
     try:
         # Try to schedule forward of messages
-        forwarded = await bot.forward_messages(
-            from_chat_id=message.chat.id,
-            chat_id=extra_config.MESSAGE_LOGGER_CHAT,
-            message_ids=to_forward_ids,
-            message_thread_id=thread_id,
+        forwarded = await call_with_limit(
+            RATE_LIMITER,
+            lambda: bot.forward_messages(
+                from_chat_id=chat_id,
+                chat_id=extra_config.MESSAGE_LOGGER_CHAT,
+                message_ids=to_forward_ids,
+                message_thread_id=thread_id,
+            ),
         )
     except (MessageIdInvalid, BaseException):
-        await asyncio.sleep(1)
         forwarded = []
 
     if len(forwarded) == len(to_forward_ids):
         return
 
-    [await m.delete() for m in forwarded]
+    if forwarded:
+        # deleted messages are skipped by telegram, find out which ones
+        current = await bot.get_messages(chat_id=chat_id, message_ids=to_forward_ids)
+        failed_ids = {msg.id for msg in current if msg.empty}
+    else:
+        failed_ids = set(to_forward_ids)
+
+    logged_ids = {message.id for message in messages}
+    source_messages = {message.id: message for message in messages}
+
+    for message in messages:
+        if message.reply_to_message:
+            source_messages.setdefault(message.reply_to_message.id, message.reply_to_message)
 
-    if reply_to_message:
-        await reply_to_message.copy(chat_id=extra_config.MESSAGE_LOGGER_CHAT, message_thread_id=thread_id)
+    for message_id in to_forward_ids:
+        if message_id not in failed_ids or message_id not in source_messages:
+            continue
+
+        message = source_messages[message_id]
+        sent_message = await call_with_limit(
+            RATE_LIMITER,
+            lambda: message.copy(chat_id=extra_config.MESSAGE_LOGGER_CHAT, message_thread_id=thread_id),
+        )
 
-    await asyncio.sleep(1)
-    sent_message = await message.copy(chat_id=extra_config.MESSAGE_LOGGER_CHAT, message_thread_id=thread_id)
-    await sent_message.reply("This message was deleted by sender.")
+        if message_id in logged_ids:
+            await call_with_limit(RATE_LIMITER, lambda: sent_message.reply("This message was deleted by sender."))
 
 
 @bot.add_cmd(cmd=["taglogger", "pmlogger"])
@@ -174,7 +497,10 @@ async def logger_switch(bot: BOT, message: Message):
 
     if "-c" in message.flags:
         await message.reply(
-            text=f"{text.capitalize()} Logger is enabled: <b>{getattr(extra_config, conf_str)}</b>!", del_in=8
+            text=f"{text.capitalize()} Logger is enabled: <b>{getattr(extra_config, conf_str)}</b>!"
+            f"\nQueued: <b>{QUEUED_MESSAGES}</b> ({QUEUED_BYTES / 1024 / 1024:.1f} MiB)"
+            f" | Overflowed: <b>{sum(OVERFLOW_COUNT.values())}</b>",
+            del_in=8,
         )
         return
 
@@ -0,0 +1,71 @@
+import asyncio
+import time
+from collections.abc import Awaitable, Callable
+
+from pyrogram.errors import FloodWait
+
+from app import bot
+
+FLOOD_RETRIES = 3
+
+# FloodWait is account wide, no limited call is made before this monotonic time
+FLOOD_WAIT_UNTIL: float = 0.0
+
+
+class RateLimiter:
+    """
+    Token bucket refilled at rate units per second, holding at most burst.
+    Callers may overdraw it and then wait until the debt is paid back, a rate of 0 means no limit.
+    Halves its rate on FloodWait and creeps back to the base rate on success.
+    """
+
+    def __init__(self, rate: float, burst: float = 1, name: str = "API calls"):
+        self.base_rate = self.rate = rate
+        self.burst = burst
+        self.name = name
+        self.tokens = float(burst)
+        self.updated = time.monotonic()
+
+    async def acquire(self, amount: float = 1):
+        if not self.rate:
+            return
+
+        now = time.monotonic()
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        self.tokens -= amount
+
+        if self.tokens < 0:
+            await asyncio.sleep(-self.tokens / self.rate)
+
+    def on_success(self):
+        self.rate = min(self.base_rate, self.rate + self.base_rate / 20)
+
+    def on_flood(self):
+        self.rate = max(self.base_rate / 16, self.rate / 2)
+
+
+async def call_with_limit(limiter: RateLimiter, func: Callable[[], Awaitable]):
+    """
+    Runs func once the limiter and any account wide FloodWait allow it,
+    retrying after FloodWait and pausing every other limited caller too.
+    """
+    global FLOOD_WAIT_UNTIL
+
+    for attempt in range(FLOOD_RETRIES + 1):
+        while (delay := FLOOD_WAIT_UNTIL - time.monotonic()) > 0:
+            await asyncio.sleep(delay)
+
+        await limiter.acquire()
+
+        try:
+            result = await func()
+            limiter.on_success()
+            return result
+
+        except FloodWait as e:
+            if attempt == FLOOD_RETRIES:
+                raise
+            FLOOD_WAIT_UNTIL = max(FLOOD_WAIT_UNTIL, time.monotonic() + int(e.value or 1))
+            limiter.on_flood()
+            bot.log.info(f"FloodWait of {e.value}s in {limiter.name}, rate now {limiter.rate * 60:.1f}/min")